@@ -5,20 +5,35 @@ import re
 import streamlit as st
 from openai import OpenAI
 
-def getChatResponse(prompt):
-    client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-    r = client.chat.completions.create(
-        model="gpt-4-1106-preview",
-        messages=([{"role": m["role"], "content": m["content"]}
-            for m in st.session_state.messages]))
-    return r.choices[0].message.content
+from chat_context import ChatContext
+from chat_llm import stream_chat
+from metadata_catalog import MetadataCatalog
 
-def runQuery(sql):
+@st.cache_resource
+def getClient():
+    return OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+
+def getChatResponse(prompt, client=None):
+    # Generator of answer text as it arrives; render with st.write_stream.
+    # Only a bounded window + rolling summary of the history is sent.
+    return stream_chat(
+        client or getClient(),
+        st.session_state.context.build(st.session_state.messages))
+
+@st.cache_resource
+def getCatalog():
+    # Local INFORMATION_SCHEMA snapshot shared by all sessions; Snowflake as fallback
     conn = st.connection("snowflake")
+    catalog = MetadataCatalog(fetch=lambda sql: conn.query(sql, ttl=0))
+    catalog.refresh_async()
+    return catalog
+
+def runQuery(sql):
     results = None
     try:
-        results = conn.query(sql)
+        results, source = getCatalog().query(sql)
         st.dataframe(results)
+        st.caption(f"Answered from {'local metadata snapshot' if source == 'local' else 'Snowflake'}")
     except:
         st.error("Wrong query!")
     return results
@@ -31,15 +46,18 @@ if first:
     st.session_state.messages = [{"role": "system", "content": 
         ("Respond with one single Snowflake query that returns"
         + " metadata from the SNOWFLAKE_SAMPLE_DATA database"
-        + f" using the INFORMATION_SCHEMA.")}]
+        + f" using the INFORMATION_SCHEMA."
+        + " Always write the views fully qualified, as SNOWFLAKE_SAMPLE_DATA.INFORMATION_SCHEMA.<view>.")}]
+# Separate check: sessions started before ChatContext existed already have messages
+if "context" not in st.session_state:
+    st.session_state.context = ChatContext()
 
 if prompt := st.chat_input(placeholder="Ask a question about Snowflake metadata"):
     st.session_state.messages.append({"role": "user", "content": prompt})
 
 if not first and st.session_state.messages[-1]["role"] != "assistant":
     with st.chat_message("assistant"):
-        response = getChatResponse(prompt)
-        st.write(response)
+        response = st.write_stream(getChatResponse(prompt))
 
         message = {"role": "assistant", "content": response}
         if sql_match := re.search(r"```sql\n(.*)\n```", response, re.DOTALL):
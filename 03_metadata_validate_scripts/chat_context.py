@@ -0,0 +1,89 @@
+#  Bounded conversation context for the metadata inspector chat.
+#  Instead of sending the whole history every turn, ChatContext sends the
+#  system prompt, a rolling summary of older turns and the most recent turns
+#  that fit a token budget. Only "role"/"content" reach the model (stored
+#  query results stay in session state). Messages are summarized once, when
+#  they leave the window, and token counts are cached per text, so the work
+#  per turn stays flat as the conversation grows.
+
+import re
+from functools import lru_cache
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except ImportError:
+    _ENCODING = None
+
+TOKEN_BUDGET = 3000     # prompt tokens sent per turn
+WINDOW = 6              # most recent messages kept verbatim
+SUMMARY_BUDGET = 400    # tokens reserved for the rolling summary
+LINE_CHARS = 200        # per-message length in the summary
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text):
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return max(1, len(text) // 4)
+
+
+def summarize_message(message):
+    """One extractive summary line: the question, or the query the answer proposed"""
+    content = " ".join(message["content"].split())
+    if message["role"] == "assistant":
+        if sql_match := re.search(r"```sql\s*(.*?)```", message["content"], re.DOTALL):
+            return "Assistant query: " + " ".join(sql_match.group(1).split())[:LINE_CHARS]
+        return "Assistant: " + content[:LINE_CHARS]
+    return "User: " + content[:LINE_CHARS]
+
+
+class ChatContext:
+    """Keep one per chat (in st.session_state); build() is called every turn."""
+
+    def __init__(self, token_budget=TOKEN_BUDGET, window=WINDOW, summary_budget=SUMMARY_BUDGET):
+        self.token_budget = token_budget
+        self.window = window
+        self.summary_budget = summary_budget
+        self.summary_lines = []
+        self.folded = 0         # history messages already folded into the summary
+        self._prefix = None     # cached (system content, summary message)
+
+    def _fold(self, message):
+        self.summary_lines.append(summarize_message(message))
+        # Oldest lines go first when the summary outgrows its budget
+        while len(self.summary_lines) > 1 and count_tokens("\n".join(self.summary_lines)) > self.summary_budget:
+            self.summary_lines.pop(0)
+        self._prefix = None
+
+    def _summary_message(self):
+        if self._prefix is None and self.summary_lines:
+            self._prefix = {
+                "role": "system",
+                "content": "Summary of the earlier conversation:\n" + "\n".join(self.summary_lines),
+            }
+        return self._prefix
+
+    def build(self, messages):
+        """Model input for the next turn; messages[0] is the system prompt"""
+        system, history = messages[0], messages[1:]
+        budget = self.token_budget - count_tokens(system["content"]) - self.summary_budget
+
+        # Newest messages first, within the window and budget; always the last one
+        keep_from, used = len(history), 0
+        while keep_from > self.folded and len(history) - keep_from < self.window:
+            cost = count_tokens(history[keep_from - 1]["content"])
+            if used + cost > budget and keep_from < len(history):
+                break
+            used += cost
+            keep_from -= 1
+
+        for message in history[self.folded:keep_from]:
+            self._fold(message)
+        self.folded = max(self.folded, keep_from)
+
+        context = [{"role": system["role"], "content": system["content"]}]
+        if summary := self._summary_message():
+            context.append(summary)
+        context.extend({"role": m["role"], "content": m["content"]} for m in history[keep_from:])
+        return context
@@ -0,0 +1,17 @@
+#  Streaming chat completions for the metadata inspector.
+#  stream_chat() yields the answer text as it arrives, for st.write_stream.
+#  The client is passed in, so any object with the OpenAI
+#  chat.completions.create(..., stream=True) interface works, including a stub.
+
+MODEL = "gpt-4-1106-preview"
+
+
+def stream_chat(client, messages, model=MODEL):
+    """Yield content deltas of one chat completion"""
+    stream = client.chat.completions.create(model=model, messages=messages, stream=True)
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
@@ -0,0 +1,129 @@
+#  Local snapshot of SNOWFLAKE_SAMPLE_DATA.INFORMATION_SCHEMA for the metadata inspector.
+#  The SCHEMATA, TABLES, COLUMNS and VIEWS views are copied into a SQLite file
+#  and refreshed in the background once the snapshot is older than
+#  REFRESH_SECONDS. Generated queries that only read those views, fully
+#  qualified as SNOWFLAKE_SAMPLE_DATA.INFORMATION_SCHEMA.<view>, are rewritten
+#  to run locally; anything else (unqualified INFORMATION_SCHEMA, which
+#  Snowflake resolves against the session's current database, other views or
+#  databases, SQL SQLite can't run, a stale snapshot, or no matching rows, e.g.
+#  an object created since the snapshot) falls back to Snowflake.
+#  The no-rows fallback only helps lookups: an aggregate such as COUNT(*)
+#  always returns a row, so it is answered from the snapshot and can be up to
+#  REFRESH_SECONDS out of date. LIKE is case-sensitive locally, as in Snowflake.
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import pandas as pd
+
+DATABASE = "SNOWFLAKE_SAMPLE_DATA"
+VIEWS = ("SCHEMATA", "TABLES", "COLUMNS", "VIEWS")
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "metadata_catalog.sqlite")
+REFRESH_SECONDS = 6 * 3600
+
+# [db.]INFORMATION_SCHEMA.view, optionally double-quoted (db is None when unqualified)
+VIEW_REF = re.compile(
+    r'(?:"?(\w+)"?\s*\.\s*)?"?INFORMATION_SCHEMA"?\s*\.\s*"?(\w+)"?',
+    re.IGNORECASE,
+)
+
+
+def to_local_sql(sql):
+    """SQLite version of a metadata query, or None if it needs Snowflake"""
+    views, foreign = set(), False
+
+    def replace(match):
+        nonlocal foreign
+        db, view = match.group(1), match.group(2).upper()
+        if not db or db.upper() != DATABASE:
+            foreign = True
+        views.add(view)
+        return view
+
+    local = VIEW_REF.sub(replace, sql.strip().rstrip(";"))
+    if foreign or not views or not views <= set(VIEWS):
+        return None
+    return local
+
+
+class MetadataCatalog:
+    """
+    fetch(sql) runs a query on Snowflake and returns a DataFrame; it is used
+    for snapshots and fallbacks. Safe to share across sessions: every query
+    opens its own SQLite connection and refreshes swap the file atomically.
+    """
+
+    @staticmethod
+    def _connect(path):
+        conn = sqlite3.connect(path)
+        # SQLite's LIKE ignores ASCII case by default; Snowflake's doesn't
+        conn.execute("PRAGMA case_sensitive_like = ON")
+        return conn
+
+    def __init__(self, fetch, path=CATALOG_PATH, max_age=REFRESH_SECONDS):
+        self.fetch = fetch
+        self.path = path
+        self.max_age = max_age
+        self._refreshing = threading.Lock()
+        self.stats = {"local": 0, "snowflake": 0}
+
+    def snapshot_age(self):
+        if not os.path.exists(self.path):
+            return None
+        with closing(sqlite3.connect(self.path)) as conn:
+            (taken_at,) = conn.execute("SELECT taken_at FROM snapshot_info").fetchone()
+        return time.time() - taken_at
+
+    def is_fresh(self):
+        age = self.snapshot_age()
+        return age is not None and age < self.max_age
+
+    def refresh(self):
+        """Copy the INFORMATION_SCHEMA views into a new SQLite file, then swap it in"""
+        if not self._refreshing.acquire(blocking=False):
+            return  # already running
+        try:
+            tmp = self.path + ".tmp"
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            with closing(sqlite3.connect(tmp)) as conn:
+                for view in VIEWS:
+                    df = self.fetch(f"SELECT * FROM {DATABASE}.INFORMATION_SCHEMA.{view}")
+                    df.to_sql(view, conn, index=False)
+                conn.execute("CREATE TABLE snapshot_info (taken_at REAL)")
+                conn.execute("INSERT INTO snapshot_info VALUES (?)", (time.time(),))
+                conn.commit()
+            os.replace(tmp, self.path)
+        finally:
+            self._refreshing.release()
+
+    def refresh_async(self):
+        """Start a background refresh if the snapshot is missing or stale"""
+        if not self.is_fresh() and not self._refreshing.locked():
+            threading.Thread(target=self.refresh, name="catalog-refresh", daemon=True).start()
+
+    def query(self, sql):
+        """
+        Run a metadata query; returns (DataFrame, "local" | "snowflake").
+        An empty local result is re-run on Snowflake; a non-empty one (including
+        any aggregate) is returned as of the snapshot.
+        """
+        local = to_local_sql(sql)
+        if local is not None and self.is_fresh():
+            try:
+                with closing(self._connect(self.path)) as conn:
+                    df = pd.read_sql_query(local, conn)
+                if not df.empty:
+                    self.stats["local"] += 1
+                    return df, "local"
+            except (sqlite3.Error, pd.errors.DatabaseError):
+                pass  # Snowflake-only syntax
+        else:
+            self.refresh_async()
+
+        self.stats["snowflake"] += 1
+        return self.fetch(sql), "snowflake"
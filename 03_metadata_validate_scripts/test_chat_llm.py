@@ -0,0 +1,55 @@
+#  Tests for stream_chat with a stub streaming client (no OpenAI key needed):
+#    python -m pytest -q test_chat_llm.py
+
+from types import SimpleNamespace
+
+from chat_llm import MODEL, stream_chat
+
+ANSWER = "The ORDERS table has 1,500,000 rows."
+
+
+def chunk(content, choices=True):
+    if not choices:
+        return SimpleNamespace(choices=[])
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class StubClient:
+    """Looks like openai.OpenAI: chat.completions.create(..., stream=True)"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        return iter(self.chunks)
+
+
+def test_stream_chat_skips_empty_deltas_and_joins_to_the_answer():
+    client = StubClient([
+        chunk(None),                     # role-only first delta
+        chunk("The ORDERS "),
+        chunk(""),
+        chunk("table has 1,500,000"),
+        chunk(None, choices=False),      # usage chunk without choices
+        chunk(" rows."),
+        chunk(None),                     # finish_reason chunk
+    ])
+    messages = [{"role": "user", "content": "How many rows are in ORDERS?"}]
+
+    deltas = list(stream_chat(client, messages))
+
+    assert deltas == ["The ORDERS ", "table has 1,500,000", " rows."]
+    assert "".join(deltas) == ANSWER
+    assert client.requests == [{"model": MODEL, "messages": messages, "stream": True}]
+
+
+def test_stream_chat_is_lazy():
+    client = StubClient([chunk("a")])
+    stream = stream_chat(client, [], model="stub")
+
+    assert client.requests == []
+    assert list(stream) == ["a"]
+    assert client.requests[0]["model"] == "stub"
@@ -5,14 +5,47 @@ from llama_index.llms.openai import OpenAI
 from llama_index.core import StorageContext, load_index_from_storage, SimpleDirectoryReader, TreeIndex
 from llama_index.core.settings import Settings  # NEW
 
+from vector_store import (
+    MemmapVectorStore, VectorQueryEngine, directory_signature, get_embed_model, sync_directory,
+)
+
 PERSIST_DIR = "./kb"
 DOCS_DIR = "./spool-empty"
 
-def getQueryEngine():
+# "tree": LLM-summarized TreeIndex in PERSIST_DIR, built once and loaded from
+#         its JSON docstore (not updated when DOCS_DIR changes)
+# "vector": local embeddings in a memory-mapped store, kept in sync with
+#         DOCS_DIR (see vector_store.py)
+INDEX_MODE = os.environ.get("INDEX_MODE", "tree")
+
+@st.cache_resource(show_spinner="Loading embedding model...")
+def getEmbedModel():
+    # Kept across engine rebuilds, so a sync doesn't reload the model
+    return get_embed_model()
+
+
+# One engine per process, shared by every browser session: the index is
+# loaded (or memory-mapped) once instead of per session. Queries don't
+# mutate it, so concurrent sessions can use it safely.
+# In vector mode the cache key is the DOCS_DIR signature, checked on every
+# run: a new, changed or deleted file gives a new key, so the next query syncs
+# the store (only the changed files) and builds a fresh engine. Sessions still
+# holding the old engine keep working: its store keeps the files it opened
+# mapped, so appends land past what it reads and compaction (which deletes and
+# rewrites the files) leaves its mapping on the old ones.
+@st.cache_resource(show_spinner="Loading knowledge base...", max_entries=1)
+def getQueryEngine(docs_signature=None):
     # 1) LLM
     client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
     Settings.llm = client  # replaces ServiceContext
 
+    if INDEX_MODE == "vector":
+        # Picks up new/deleted files in DOCS_DIR; unchanged ones are not re-embedded
+        embed_model = getEmbedModel()
+        store = MemmapVectorStore()
+        sync_directory(store, DOCS_DIR, embed_model)
+        return VectorQueryEngine(store, embed_model, client)
+
     # 2) Build index only if not already persisted
     if not os.path.exists(PERSIST_DIR) or not os.listdir(PERSIST_DIR):
         reader = SimpleDirectoryReader(DOCS_DIR)
@@ -24,13 +57,20 @@ def getQueryEngine():
     # 3) Load index + return query engine
     storage_context = StorageContext.from_defaults(persist_dir=PERSIST_DIR)
     index = load_index_from_storage(storage_context)
-    return index.as_query_engine()
+    return index.as_query_engine(streaming=True)
+
+
+def streamResponse(query_engine, prompt):
+    # Answer text as it is generated, for st.write_stream
+    if isinstance(query_engine, VectorQueryEngine):
+        yield from query_engine.stream_query(prompt)
+    else:
+        yield from query_engine.query(prompt).response_gen
 
 
 st.title("ChatGPT Agent for Custom Content")
 
-if "query_engine" not in st.session_state:
-    st.session_state.query_engine = getQueryEngine()
+query_engine = getQueryEngine(directory_signature(DOCS_DIR) if INDEX_MODE == "vector" else None)
 
 if "messages" not in st.session_state:
     st.session_state.messages = [{
@@ -54,10 +94,7 @@ if prompt := st.chat_input():
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
-        response = st.session_state.query_engine.query(prompt)
-
-        # response can be a Response object; render as string safely
-        response_text = str(response)
-        st.markdown(response_text)
+        # Tokens render as they arrive; write_stream returns the full text
+        response_text = st.write_stream(streamResponse(query_engine, prompt))
 
         st.session_state.messages.append({"role": "assistant", "content": response_text})
@@ -0,0 +1,64 @@
+# Benchmark: TreeIndex vs the memory-mapped vector store.
+# Builds both indexes from the same documents (into temporary directories, so
+# ./kb and ./kb_vectors are left alone), then times a few queries against each.
+# TreeIndex build time includes the LLM summary calls; the vector build only
+# runs the local embedding model.
+#
+# Command: python bench_index.py --docs ./spool --queries 5
+
+import argparse
+import os
+import tempfile
+import time
+
+from llama_index.llms.openai import OpenAI
+from llama_index.core import SimpleDirectoryReader, TreeIndex
+from llama_index.core.settings import Settings
+
+from vector_store import MemmapVectorStore, VectorQueryEngine, get_embed_model, sync_directory
+
+QUESTIONS = [
+    "What is this document about?",
+    "How do I deploy a Streamlit app in Snowflake?",
+    "Which Snowflake features are covered?",
+    "How is ChatGPT used with Snowflake?",
+    "What are the main limitations mentioned?",
+]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def report(name, build, queries):
+    avg = sum(queries) / len(queries) if queries else 0.0
+    print(f"{name:<8} build={build:>8.2f}s  avg query={avg:>6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TreeIndex vs memmap vector index")
+    parser.add_argument("--docs", default="./spool-empty")
+    parser.add_argument("--queries", type=int, default=3)
+    args = parser.parse_args()
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.queries)]
+
+    llm = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    Settings.llm = llm
+
+    documents = SimpleDirectoryReader(args.docs).load_data()
+    tree, build = timed(TreeIndex.from_documents, documents)
+    engine = tree.as_query_engine()
+    report("tree", build, [timed(engine.query, q)[1] for q in questions])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        embed_model = get_embed_model()
+        store = MemmapVectorStore(tmp)
+        _, build = timed(sync_directory, store, args.docs, embed_model)
+        engine = VectorQueryEngine(store, embed_model, llm)
+        report("vector", build, [timed(engine.query, q)[1] for q in questions])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# Tests for MemmapVectorStore and VectorQueryEngine (numpy only, with stub
+# embedding model and LLM):
+#   python -m pytest -q test_vector_store.py
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from vector_store import MemmapVectorStore, VectorQueryEngine
+
+
+def vectors(n, dim=4, seed=0):
+    v = np.random.default_rng(seed).random((n, dim), dtype=np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def all_texts(store):
+    return {doc: [store.text(r) for r in range(start, end)] for doc, (start, end) in store.docs.items()}
+
+
+def test_add_save_reload(tmp_path):
+    store = MemmapVectorStore(str(tmp_path))
+    store.add("a.txt", ["alpha one", "alpha two"], vectors(2))
+    store.add("b.txt", ["béta"], vectors(1, seed=1))
+    store.save()
+
+    reopened = MemmapVectorStore(str(tmp_path))
+    assert reopened.count == 3
+    assert all_texts(reopened) == {"a.txt": ["alpha one", "alpha two"], "b.txt": ["béta"]}
+    np.testing.assert_allclose(reopened.vectors[:3], np.vstack([vectors(2), vectors(1, seed=1)]))
+
+
+def test_interrupted_sync_leaves_no_orphaned_text(tmp_path):
+    store = MemmapVectorStore(str(tmp_path))
+    store.add("a.txt", ["alpha"], vectors(1))
+    store.save()
+
+    # Sync stops after add() and before save(): the bytes are in texts.bin,
+    # but no saved offset points to them
+    interrupted = MemmapVectorStore(str(tmp_path))
+    interrupted.add("x.txt", ["SECRET ORPHANED TEXT"], vectors(1, seed=1))
+    del interrupted
+
+    # The next sync starts from the saved state and appends after it
+    store = MemmapVectorStore(str(tmp_path))
+    assert "x.txt" not in store.docs
+    store.add("y.txt", ["yankee"], vectors(1, seed=2))
+    store.save()
+
+    reopened = MemmapVectorStore(str(tmp_path))
+    assert all_texts(reopened) == {"a.txt": ["alpha"], "y.txt": ["yankee"]}
+    assert (tmp_path / "texts.bin").read_bytes() == b"alphayankee"
+
+
+def test_search_skips_removed_documents_and_compact(tmp_path):
+    store = MemmapVectorStore(str(tmp_path))
+    v = vectors(3)
+    store.add("a.txt", ["a0", "a1"], v[:2])
+    store.add("b.txt", ["b0"], v[2:])
+    store.remove("a.txt")
+
+    assert [text for _, text in store.search(v[0], k=3)] == ["b0"]
+
+    store.compact()
+    store.save()
+    reopened = MemmapVectorStore(str(tmp_path))
+    assert reopened.count == 1
+    assert [text for _, text in reopened.search(v[2], k=1)] == ["b0"]
+
+
+def test_open_store_reads_old_files_after_another_store_compacts(tmp_path):
+    writer = MemmapVectorStore(str(tmp_path))
+    v = vectors(3)
+    writer.add("a.txt", ["alpha text"], v[:1])
+    writer.add("b.txt", ["héllo b text"], v[1:2])
+    writer.save()
+
+    # A session still holding the old engine
+    reader = MemmapVectorStore(str(tmp_path))
+
+    writer.remove("a.txt")
+    writer.add("c.txt", ["c"], v[2:])
+    writer.compact()
+    writer.save()
+
+    assert [text for _, text in reader.search(v[0], k=2)] == ["alpha text", "héllo b text"]
+    assert all_texts(reader) == {"a.txt": ["alpha text"], "b.txt": ["héllo b text"]}
+    assert all_texts(MemmapVectorStore(str(tmp_path))) == {"b.txt": ["héllo b text"], "c.txt": ["c"]}
+
+
+class StubEmbedModel:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def get_text_embedding_batch(self, texts):
+        return [self.vectors[t] for t in texts]
+
+
+class StubLLM:
+    """Streams a fixed answer the way llama_index LLMs do: one response per delta"""
+
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.prompts = []
+
+    def stream_complete(self, prompt):
+        self.prompts.append(prompt)
+        text = ""
+        for delta in self.deltas:
+            text += delta or ""
+            yield SimpleNamespace(text=text, delta=delta)
+
+    def complete(self, prompt):
+        return SimpleNamespace(text="".join(d or "" for d in self.deltas))
+
+
+def test_stream_query_skips_empty_deltas_and_joins_to_the_answer(tmp_path):
+    store = MemmapVectorStore(str(tmp_path))
+    v = vectors(2)
+    store.add("a.txt", ["Snowflake stores data in micro-partitions."], v[:1])
+    store.add("b.txt", ["Unrelated chunk."], v[1:])
+    llm = StubLLM(["", "Micro", None, "-partitions", ""])
+    engine = VectorQueryEngine(store, StubEmbedModel({"How is data stored?": v[0]}), llm, top_k=1)
+
+    deltas = list(engine.stream_query("How is data stored?"))
+
+    assert deltas == ["Micro", "-partitions"]
+    assert "".join(deltas) == engine.query("How is data stored?") == "Micro-partitions"
+    assert "Snowflake stores data in micro-partitions." in llm.prompts[0]
+    assert "Unrelated chunk." not in llm.prompts[0]
@@ -0,0 +1,332 @@
+# Vector index mode for the llama_index app.
+# Chunks are embedded locally (HuggingFace model, no LLM calls at build time)
+# and kept in memory-mapped binary files (vectors, chunk texts, offsets).
+# A query is one matrix-vector product plus one LLM completion, instead of
+# the LLM calls a TreeIndex makes while building and traversing.
+# sync_directory() keeps the store in step with DOCS_DIR through a manifest
+# of (path, mtime, size, sha256): only new or changed files are parsed (in
+# worker processes) and embedded, and deleted files are removed.
+
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+VECTOR_DIR = "./kb_vectors"
+EMBED_MODEL = "BAAI/bge-small-en-v1.5"
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 50
+TOP_K = 4
+
+QA_TEMPLATE = (
+    "Context information is below.\n"
+    "---------------------\n"
+    "{context}\n"
+    "---------------------\n"
+    "Given the context information and not prior knowledge, answer the query.\n"
+    "Query: {question}\n"
+    "Answer: "
+)
+
+
+def get_embed_model():
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    return HuggingFaceEmbedding(model_name=EMBED_MODEL)
+
+
+def embed(embed_model, texts):
+    """Unit-length float32 embeddings, so a dot product is the cosine similarity"""
+    vectors = np.asarray(embed_model.get_text_embedding_batch(texts), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+    return vectors
+
+
+def load_chunks(path):
+    """Parse one file and split it into text chunks"""
+    from llama_index.core import SimpleDirectoryReader
+    from llama_index.core.node_parser import SentenceSplitter
+
+    documents = SimpleDirectoryReader(input_files=[path]).load_data()
+    splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return [node.get_content() for node in splitter.get_nodes_from_documents(documents)]
+
+
+class MemmapVectorStore:
+    """
+    Everything large is a flat binary file, memory-mapped on load, so opening
+    the store costs a few small reads and its pages are shared by every
+    session (and process) that uses it:
+
+      vectors.f32  one float32 row per chunk (capacity grows by doubling)
+      texts.bin    UTF-8 chunk texts back to back
+      offsets.npy  int64 start of each chunk in texts.bin (count + 1 entries)
+      meta.json    dimension, row count and each document's [start, end) rows
+
+    Removed documents leave dead rows behind until compact() rewrites the files.
+    Only what save() recorded counts: texts.bin may hold trailing bytes from an
+    unsaved add(), and they are cut off before the next append.
+    texts.bin and vectors.f32 are mapped when the store is opened and stay
+    mapped: after another store compacts (deletes and rewrites both files),
+    this one still reads the old files, which match its offsets.
+    """
+
+    def __init__(self, path=VECTOR_DIR):
+        self.path = path
+        self.dim = None
+        self.count = 0
+        self.docs = {}                               # document path -> [start, end) rows
+        self.vectors = None
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self._blob = None                            # memmap of texts.bin
+        self._dead = None                            # cached row ids of removed chunks
+        if os.path.exists(self._file("meta.json")):
+            self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        with open(self._file("meta.json")) as f:
+            meta = json.load(f)
+        self.dim, self.count, self.docs = meta["dim"], meta["count"], meta["docs"]
+        self.offsets = np.load(self._file("offsets.npy"), mmap_mode="r")
+        if self.count:
+            capacity = os.path.getsize(self._file("vectors.f32")) // (4 * self.dim)
+            self.vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+",
+                                     shape=(capacity, self.dim))
+        self._map_texts()
+
+    def _map_texts(self):
+        # Only the saved part: bytes past offsets[-1] belong to no chunk
+        size = int(self.offsets[-1])
+        if not size:
+            self._blob = np.zeros(0, dtype=np.uint8)
+            return
+        self._blob = np.memmap(self._file("texts.bin"), dtype=np.uint8, mode="r", shape=(size,))
+
+    def _reserve(self, rows):
+        capacity = 0 if self.vectors is None else self.vectors.shape[0]
+        if self.count + rows <= capacity:
+            return
+        new_capacity = max(64, capacity * 2, self.count + rows)
+        os.makedirs(self.path, exist_ok=True)
+        if self.vectors is not None:
+            self.vectors.flush()
+        self.vectors = None
+        # Grow the file in place; existing rows keep their offsets
+        with open(self._file("vectors.f32"), "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+",
+                                 shape=(new_capacity, self.dim))
+
+    def text(self, row):
+        return self._blob[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+    def add(self, doc, texts, vectors):
+        """Append a document's chunks (replacing any previous version of it)"""
+        if doc in self.docs:
+            self.remove(doc)
+        if not texts:
+            self.docs[doc] = [self.count, self.count]
+            return
+        self.dim = self.dim or vectors.shape[1]
+        self._reserve(len(texts))
+        self.vectors[self.count:self.count + len(texts)] = vectors
+
+        encoded = [t.encode("utf-8") for t in texts]
+        with open(self._file("texts.bin"), "ab") as f:
+            # Drop bytes no saved offset points to (an add() that was never
+            # saved, e.g. an interrupted sync) so the new chunks start at offsets[-1]
+            f.truncate(int(self.offsets[-1]))
+            f.write(b"".join(encoded))
+        ends = self.offsets[-1] + np.cumsum([len(b) for b in encoded], dtype=np.int64)
+        self.offsets = np.concatenate([self.offsets, ends])
+        self._map_texts()
+
+        self.docs[doc] = [self.count, self.count + len(texts)]
+        self.count += len(texts)
+        self._dead = None
+
+    def remove(self, doc):
+        if self.docs.pop(doc, None) is not None:
+            self._dead = None
+
+    def live_mask(self):
+        alive = np.zeros(self.count, dtype=bool)
+        for start, end in self.docs.values():
+            alive[start:end] = True
+        return alive
+
+    def dead_rows(self):
+        if self._dead is None:
+            self._dead = np.flatnonzero(~self.live_mask())
+        return self._dead
+
+    def compact(self):
+        """Rewrite the files without the rows of removed documents"""
+        old_docs = sorted(self.docs.items(), key=lambda item: item[1][0])
+        vectors = self.vectors
+        texts = [[self.text(r) for r in range(start, end)] for _, (start, end) in old_docs]
+        rows = [vectors[start:end].copy() for _, (start, end) in old_docs]
+
+        self.vectors, self._blob = None, None
+        for name in ("vectors.f32", "texts.bin"):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+        self.count, self.docs = 0, {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        for (doc, _), doc_texts, doc_rows in zip(old_docs, texts, rows):
+            self.add(doc, doc_texts, doc_rows)
+        self._dead = None
+
+    def search(self, query_vector, k=TOP_K):
+        """Top-k (score, text) pairs by cosine similarity"""
+        if not self.count:
+            return []
+        scores = np.asarray(self.vectors[:self.count] @ query_vector)
+        dead = self.dead_rows()
+        scores[dead] = -np.inf
+        k = min(k, self.count - len(dead))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.text(i)) for i in top]
+
+    def save(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+        os.makedirs(self.path, exist_ok=True)
+        np.save(self._file("offsets.tmp.npy"), np.asarray(self.offsets))
+        os.replace(self._file("offsets.tmp.npy"), self._file("offsets.npy"))
+        with open(self._file("meta.json.tmp"), "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "docs": self.docs}, f)
+        os.replace(self._file("meta.json.tmp"), self._file("meta.json"))
+
+
+# ---------- Incremental ingestion ----------
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(store):
+    path = os.path.join(store.path, "manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(store, manifest):
+    os.makedirs(store.path, exist_ok=True)
+    path = os.path.join(store.path, "manifest.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def directory_signature(docs_dir):
+    """
+    Digest of (path, mtime, size) for every file in docs_dir: stat calls only,
+    cheap enough to check before every query to see whether a sync is due
+    """
+    h = hashlib.sha256()
+    for root, _, names in sorted(os.walk(docs_dir)):
+        for name in sorted(names):
+            st = os.stat(os.path.join(root, name))
+            h.update(f"{os.path.join(root, name)}\0{st.st_mtime}\0{st.st_size}\n".encode())
+    return h.hexdigest()
+
+
+def scan_directory(docs_dir, manifest):
+    """
+    Compare docs_dir with the manifest. Files whose mtime and size match are
+    not read at all; otherwise the content hash decides whether they changed.
+    Returns (to_index, removed, entries): entries is the new manifest.
+    """
+    to_index, entries = [], {}
+    for root, _, names in os.walk(docs_dir):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            entry = {"mtime": st.st_mtime, "size": st.st_size}
+            old = manifest.get(path)
+            if old and old["mtime"] == entry["mtime"] and old["size"] == entry["size"]:
+                entries[path] = old
+                continue
+            entry["sha256"] = file_hash(path)
+            entries[path] = entry
+            if not old or old.get("sha256") != entry["sha256"]:
+                to_index.append(path)
+    removed = sorted(set(manifest) - set(entries))
+    return to_index, removed, entries
+
+
+def sync_directory(store, docs_dir, embed_model, workers=None):
+    """
+    Index new and changed files in docs_dir and drop removed ones. Parsing and
+    chunking (the slow part for PDFs) runs in worker processes; embedding stays
+    in this process so the model is loaded once.
+    Returns {"indexed": [...], "removed": [...], "unchanged": n}.
+    """
+    # Only trust manifest entries the store actually holds (e.g. after a store reset)
+    manifest = {path: e for path, e in load_manifest(store).items() if path in store.docs}
+    to_index, removed, entries = scan_directory(docs_dir, manifest)
+
+    for doc in removed:
+        store.remove(doc)
+
+    if to_index:
+        # Spawned, not forked: the caller has usually loaded the embedding
+        # model already, and forking a process with live torch/tokenizer
+        # threads can deadlock. Workers only import the llama_index parsers.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(load_chunks, doc): doc for doc in to_index}
+            for future in as_completed(futures):
+                doc = futures[future]
+                texts = future.result()
+                store.add(doc, texts, embed(embed_model, texts) if texts else None)
+
+    if len(store.dead_rows()) > store.count // 4:
+        store.compact()
+    if to_index or removed or entries != manifest:
+        store.save()
+        # Written after the store, so a crash mid-sync re-indexes instead of losing files
+        save_manifest(store, entries)
+    return {"indexed": to_index, "removed": removed, "unchanged": len(entries) - len(to_index)}
+
+
+class VectorQueryEngine:
+    """query() = one embedding lookup + one completion"""
+
+    def __init__(self, store, embed_model, llm, top_k=TOP_K):
+        self.store = store
+        self.embed_model = embed_model
+        self.llm = llm
+        self.top_k = top_k
+
+    def retrieve(self, question):
+        query_vector = embed(self.embed_model, [question])[0]
+        return self.store.search(query_vector, self.top_k)
+
+    def build_prompt(self, question):
+        context = "\n\n".join(text for _, text in self.retrieve(question))
+        return QA_TEMPLATE.format(context=context, question=question)
+
+    def query(self, question):
+        return self.llm.complete(self.build_prompt(question)).text
+
+    def stream_query(self, question):
+        """Yield the answer text as the LLM produces it"""
+        for chunk in self.llm.stream_complete(self.build_prompt(question)):
+            if chunk.delta:
+                yield chunk.delta
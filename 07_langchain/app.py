@@ -1,6 +1,8 @@
+import hashlib
 import os.path
 import streamlit as st
 from snowflake.snowpark import Session
+from sqlalchemy import MetaData, create_engine
 from langchain_community.utilities import SQLDatabase
 from langchain_openai import OpenAI
 from langchain.chains import create_sql_query_chain
@@ -44,30 +46,68 @@ def getParams():
             if len(openai_key) == 0 and not submit: st.stop()
     return openai_key, pars
 
+def getUrl(pars):
+    return (f"snowflake://{pars['user']}:{pars['password']}@{pars['account']}"
+        + f"/{pars['database']}/{pars['schema']}"
+        + f"?warehouse={pars['warehouse']}&role={pars['role']}")
+
 @st.cache_resource(show_spinner="Connecting...")
 def getSession(openai_key, pars):
     session = Session.builder.configs(pars).create()
-
-    url = (f"snowflake://{pars['user']}:{pars['password']}@{pars['account']}"
-        + f"/{pars['database']}/{pars['schema']}"
-        + f"?warehouse={pars['warehouse']}&role={pars['role']}")
-    db = SQLDatabase.from_uri(url)
     llm = OpenAI(openai_api_key=openai_key)
-    chain = create_sql_query_chain(llm, db)
-    return session, db, chain
+    return session, llm
+
+# Identifies the LLM in cache keys (the LLM object itself isn't hashed): a new
+# API key or model builds a new chain and regenerates SQL. Only a hash of the key is kept.
+def getLlmId(openai_key, llm):
+    return hashlib.sha256(openai_key.encode()).hexdigest()[:16], llm.model_name
+
+# Cheap schema fingerprint: one aggregate over the column metadata, re-read
+# at most every 5 minutes. Table/column/type changes produce a new value.
+@st.cache_data(ttl=300, show_spinner=False)
+def getSchemaFingerprint(_session, account, database, schema):
+    schema_lit = schema.replace("'", "''")
+    h = _session.sql(
+        f"SELECT HASH_AGG(TABLE_NAME, COLUMN_NAME, DATA_TYPE) AS H"
+        + f" FROM {database}.INFORMATION_SCHEMA.COLUMNS"
+        + f" WHERE TABLE_SCHEMA = '{schema_lit}'").collect()[0]["H"]
+    return f"{account}/{database}/{schema}:{h}"
+
+# table_info (DDL + sample rows per table) is computed once per fingerprint and
+# used as the chain's custom table info, so invoke() no longer introspects
+# tables or reads sample rows.
+@st.cache_resource(show_spinner="Reading schema...", max_entries=4)
+def getChain(_llm, llm_id, pars, fingerprint):
+    engine = create_engine(getUrl(pars))
+    # Tables are reflected once, into this MetaData; the chain's SQLDatabase
+    # reuses it (lazy reflection finds every table already there)
+    metadata = MetaData()
+    reader = SQLDatabase(engine, metadata=metadata)
+    table_info = {t: reader.get_table_info([t]) for t in reader.get_usable_table_names()}
+    db = SQLDatabase(engine, metadata=metadata, custom_table_info=table_info, lazy_table_reflection=True)
+    return create_sql_query_chain(_llm, db), "\n\n".join(table_info.values())
+
+# Generated SQL memoized by (question, schema fingerprint, LLM): reruns from
+# other widgets, or asking the same question again, skip the LLM round trip.
+@st.cache_data(show_spinner="Generating SQL...", max_entries=500)
+def generateSql(_chain, question, fingerprint, llm_id):
+    return _chain.invoke({"question": question})
 
 
 st.title("LangChain SQL Generator")
 st.write("Returns and runs queries from questions in natural language.")
 
 openai_key, pars = getParams()
-session, db, chain = getSession(openai_key, pars)
+session, llm = getSession(openai_key, pars)
+fingerprint = getSchemaFingerprint(session, pars["account"], pars["database"], pars["schema"])
+llm_id = getLlmId(openai_key, llm)
+chain, table_info = getChain(llm, llm_id, pars, fingerprint)
 
 question = st.sidebar.text_area("Ask a question:",
     value="show me the total number of entries in the first table")
-sql = chain.invoke({"question": question})
+sql = generateSql(chain, " ".join(question.split()), fingerprint, llm_id)
 
 tabQuery, tabData, tabLog = st.tabs(["Query", "Data", "Log"])
 tabQuery.code(sql, language="sql")
 tabData.dataframe(session.sql(sql))
-tabLog.code(db.table_info, language="sql")
+tabLog.code(table_info, language="sql")
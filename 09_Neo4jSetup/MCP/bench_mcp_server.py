@@ -0,0 +1,180 @@
+## Load test for the MCP server's tool layer, with simulated tools.
+## Swaps the real tool functions in mcp_server_5.TOOLS for fakes that sleep
+## (like a blocking Snowflake/Neo4j call), fires many tool calls at once and
+## compares the old inline handling (every call blocks the event loop) with
+## run_tool() (thread pool + per-tool limits + timeouts).
+## --slow-pct makes that share of calls overrun the tool timeout.
+## --startup instead measures server cold start (import time and peak RSS in a
+## fresh interpreter), next to the cost of importing Streamlit, which the
+## server used to pull in for st.connection. --baseline REV also measures the
+## server as it was at git revision REV, checked out into a temporary
+## directory; pass the pre-change revision (the commit before the server moved
+## to snowflake_utils, as found with git log) to compare against it.
+##
+## Command: python bench_mcp_server.py --calls 200 --latency 0.2 --slow-pct 5
+##          python bench_mcp_server.py --startup --baseline <pre-change revision>
+
+import argparse
+import asyncio
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import mcp_server_5 as server
+from mcp_server_5 import TOOLS, ToolSpec, run_tool, shutdown_tool_executor
+
+
+def fake_tool(name: str, latency: float, slow_pct: float, timeout: float, running: dict):
+    lock = threading.Lock()
+
+    def fn(arguments: dict):
+        with lock:
+            running[name] = running.get(name, 0) + 1
+            running[f"{name}_peak"] = max(running.get(f"{name}_peak", 0), running[name])
+        try:
+            slow = random.uniform(0, 100) < slow_pct
+            time.sleep(timeout * 1.5 if slow else random.uniform(0.5, 1.5) * latency)
+            return {"tool": name, "arguments": arguments}
+        finally:
+            with lock:
+                running[name] -= 1
+
+    return fn
+
+
+def install_fakes(latency: float, slow_pct: float, timeout: float):
+    running = {}
+    for name, spec in list(TOOLS.items()):
+        TOOLS[name] = ToolSpec(
+            fake_tool(name, latency, slow_pct, timeout, running),
+            max_concurrency=spec.max_concurrency,
+            timeout=timeout,
+        )
+    return running
+
+
+def make_calls(n: int):
+    names = list(TOOLS)
+    return [(names[i % len(names)], {"question": f"q{i}", "customer_id": f"C{i:03d}"}) for i in range(n)]
+
+
+async def timed(coro, submitted: float):
+    # Latency as the agent sees it: from submission (all calls at once) to reply
+    try:
+        await coro
+        ok = True
+    except TimeoutError:
+        ok = False
+    return time.perf_counter() - submitted, ok
+
+
+async def blocking_call(name: str, arguments: dict):
+    # What call_tool used to do: run the tool inline on the event loop
+    return TOOLS[name].fn(arguments)
+
+
+async def run_batch(calls, call):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(timed(call(name, args), start) for name, args in calls))
+    return time.perf_counter() - start, results
+
+
+def report(label: str, wall: float, results):
+    latencies = sorted(r[0] for r in results)
+    timeouts = sum(1 for r in results if not r[1])
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+    print(
+        f"{label:<10} {len(results) / wall:>8.1f} calls/s  wall={wall:>6.2f}s  "
+        f"p50={statistics.median(latencies) * 1000:>7.1f}ms  p95={p95 * 1000:>7.1f}ms  "
+        f"timeouts={timeouts}"
+    )
+
+
+# Peak RSS comes from VmHWM on Linux: ru_maxrss survives fork+exec there, so
+# the child would report the (larger) benchmark process instead of itself
+STARTUP_PROBE = """
+import resource, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+try:
+    with open("/proc/self/status") as f:
+        rss = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 / 1024   # macOS: bytes
+print(seconds, rss)
+"""
+
+
+def measure_startup(module: str, runs: int = 5, cwd: Path = None):
+    """Median import seconds and peak RSS (MB) of `module` in fresh interpreters"""
+    seconds, rss = [], []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE.format(module=module)],
+            cwd=cwd or Path(__file__).resolve().parent, capture_output=True, text=True, check=True,
+        ).stdout.split()
+        seconds.append(float(out[0]))
+        rss.append(float(out[1]))
+    return statistics.median(seconds), statistics.median(rss)
+
+
+def checkout_server(rev: str, dest: str) -> Path:
+    """Extract this directory's parent (09_Neo4jSetup) at `rev` into dest; returns its MCP dir"""
+    here = Path(__file__).resolve().parent
+    # Paths in the archive are relative to 09_Neo4jSetup
+    archive = subprocess.run(
+        ["git", "archive", rev, "."], cwd=here.parent, capture_output=True, check=True,
+    ).stdout
+    subprocess.run(["tar", "-x", "-C", dest], input=archive, check=True)
+    return Path(dest) / here.name
+
+
+def report_startup(baseline: str = None):
+    rows = [(f"import {module}", module, None) for module in ("mcp_server_5", "streamlit")]
+    with tempfile.TemporaryDirectory() as tmp:
+        if baseline:
+            rows.insert(1, (f"mcp_server_5 @ {baseline}", "mcp_server_5", checkout_server(baseline, tmp)))
+        for label, module, cwd in rows:
+            seconds, rss = measure_startup(module, cwd=cwd)
+            print(f"{label:<28} {seconds * 1000:>8.1f}ms  peak RSS={rss:>7.1f}MB")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Parallel tool-call load test for mcp_server_5")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="mean simulated tool latency (s)")
+    parser.add_argument("--timeout", type=float, default=2.0, help="per-tool timeout (s)")
+    parser.add_argument("--slow-pct", type=float, default=0.0, help="%% of calls that overrun the timeout")
+    parser.add_argument("--skip-blocking", action="store_true", help="skip the old inline baseline")
+    parser.add_argument("--startup", action="store_true", help="measure cold start instead")
+    parser.add_argument("--baseline", metavar="REV", help="with --startup, also measure the server at git REV")
+    args = parser.parse_args()
+
+    if args.startup:
+        report_startup(args.baseline)
+        return
+
+    running = install_fakes(args.latency, args.slow_pct, args.timeout)
+    calls = make_calls(args.calls)
+
+    try:
+        if not args.skip_blocking:
+            report("blocking", *await run_batch(calls, blocking_call))
+        report("threaded", *await run_batch(calls, run_tool))
+    finally:
+        # Let overrunning fake calls finish so the peaks are complete
+        server.get_tool_executor().shutdown(wait=True)
+        shutdown_tool_executor()
+
+    for name, spec in TOOLS.items():
+        print(f"  {name:<20} limit={spec.max_concurrency:<3} peak concurrent={running.get(f'{name}_peak', 0)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,51 +2,29 @@
 # This uses Cortex Search as your RAG retriever
 # the LLM will then see those chunks as context.
 
-import json
+import sys
+from pathlib import Path
+
 import streamlit as st
 
+# Shared retriever lives one level up (09_Neo4jSetup)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from cortex_retrieval import CortexRetriever
+
 # Use the fully-qualified service name (prevents context issues)
 SEARCH_SERVICE = "KG_DEMO_DB.PUBLIC.DOCS_SEARCH"
 MODEL_NAME = "snowflake-arctic"   # change if your Playground shows a different one
 
+retriever = CortexRetriever(service=SEARCH_SERVICE)
+
 
 def cortex_rag_search(question: str, limit: int = 5):
     """
     Cortex Search retriever using SYSTEM$CORTEX_SEARCH_QUERY
     because this account rejects SEARCH_PREVIEW payload objects.
+    Shared implementation in cortex_retrieval.py.
     """
-    conn = st.connection("snowflake")
-
-    payload = {"query": question, "limit": int(limit)}
-    payload_str = json.dumps(payload)
-
-    # Escape single quotes for Snowflake SQL string literal
-    payload_str = payload_str.replace("'", "''")
-
-    sql = f"""
-    SELECT SYSTEM$CORTEX_SEARCH_QUERY(
-      '{SEARCH_SERVICE}',
-      '{payload_str}'
-    ) AS RESULT;
-    """
-
-    df = conn.query(sql)
-    raw = df["RESULT"].iloc[0]
-
-    # RESULT is typically JSON string
-    res = json.loads(raw) if isinstance(raw, str) else raw
-
-    flat = []
-    for r in res.get("results", []):
-        rec = r.get("record", {})
-        flat.append({
-            "doc_id":  rec.get("DOC_ID"),
-            "title":   rec.get("TITLE"),
-            "section": rec.get("SECTION"),
-            "content": rec.get("CONTENT"),
-            "score":   r.get("score"),
-        })
-    return flat
+    return retriever.search(question, limit)
 
 
 def cortex_analyst_summarize_sales(question: str) -> str:
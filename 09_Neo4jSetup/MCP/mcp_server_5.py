@@ -2,7 +2,7 @@
 # to provide tools for semantic search over enterprise docs in Snowflake via Cortex Search, 
 # answering analytics questions over Snowflake tables using Cortex COMPLETE, 
 # and returning graph neighborhood around a customer from Neo4j KG. 
-# The server is implemented using the `streamlit` library and the `neo4j` library. 
+# Snowflake is reached through snowflake_utils (pooled connector, no Streamlit) and Neo4j through the `neo4j` library. 
 # The `cortex_rag_search` function uses the Snowflake Cortex Search API to retrieve semantically 
 # relevant document chunks for RAG. The `cortex_analyst_summarize_sales` 
 # function uses the Snowflake Cortex COMPLETE API to answer natural-language analytics 
@@ -10,12 +10,26 @@
 # returns a small neighborhood around a customer from Neo4j. 
 # The `main` function runs the server using the `stdio_server` 
 # context manager from the `mcp.server.stdio` module.
+# The tool functions are blocking, so call_tool runs them on a thread pool;
+# each tool has its own concurrency limit and timeout (see TOOLS below), and
+# the stdio loop keeps serving other requests while a call is in flight.
 import asyncio
-import json
-
-import streamlit as st
-import pandas as pd
-from neo4j import GraphDatabase
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+# Shared helpers live one level up (09_Neo4jSetup)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from neo4j_utils import close_neo4j_drivers, get_neo4j_driver as get_shared_driver
+from snowflake_utils import close_snowflake_pool, query_rows
+from cortex_retrieval import retriever
+from graph_neighborhood import (
+    cached_customer_neighborhood,
+    get_customer_neighborhoods as batch_neighborhoods,
+    neighborhoods_to_json,
+)
 
 from mcp.server import Server
 from mcp.types import Tool, Result
@@ -30,38 +44,10 @@ def cortex_rag_search(question: str, limit: int = 5):
     Use Snowflake Cortex Search (DOCS_SEARCH) to retrieve
     semantically relevant document chunks for RAG.
 
-    Requires st.connection("snowflake") to be configured
-    (same as your Streamlit app's Snowflake connection).
-    """
-    conn = st.connection("snowflake")
-
-    payload = json.dumps({
-        "query": question,
-        "limit": limit
-    })
-
-    sql = """
-        SELECT SNOWFLAKE.CORTEX.SEARCH_PREVIEW(
-          'DOCS_SEARCH',
-          PARSE_JSON(%(payload)s)
-        ) AS RESULT
+    Delegates to the shared retriever in cortex_retrieval.py (bound
+    parameters, question cache, one result shape for every caller).
     """
-
-    df = conn.query(sql, params={"payload": payload})
-    raw = df["RESULT"].iloc[0]  # JSON string
-    res = json.loads(raw)
-
-    flat = []
-    for r in res.get("results", []):
-        rec = r.get("record", {})
-        flat.append({
-            "doc_id":  rec.get("DOC_ID"),
-            "title":   rec.get("TITLE"),
-            "section": rec.get("SECTION"),
-            "content": rec.get("CONTENT"),
-            "score":   r.get("score"),
-        })
-    return flat
+    return retriever.search(question, limit)
 
 
 def cortex_analyst_summarize_sales(question: str) -> str:
@@ -71,7 +57,6 @@ def cortex_analyst_summarize_sales(question: str) -> str:
 
     This is a lightweight 'analyst' function you can expose as a tool.
     """
-    conn = st.connection("snowflake")
 
     sql = """
     SELECT SNOWFLAKE.CORTEX.COMPLETE(
@@ -89,8 +74,7 @@ def cortex_analyst_summarize_sales(question: str) -> str:
     ) AS ANSWER;
     """
 
-    df = conn.query(sql, params={"question": question})
-    return df["ANSWER"].iloc[0]
+    return query_rows(sql, params={"question": question})[0]["ANSWER"]
 
 
 # ========= Neo4j helpers =========
@@ -102,50 +86,123 @@ NEO4J_PASSWORD = "iY7-J53QwICOVljzY7UrvLVuJ4LNGOyaEC57K38nkKY"
 
 
 def get_neo4j_driver():
-    return GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    # Process-wide pooled driver, reused by every tool call
+    return get_shared_driver(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
 
 
 def get_customer_neighborhood(customer_id: str, depth: int = 2):
     """
     Return a small neighborhood around a customer from Neo4j.
-    Used by the neo4j_neighborhood MCP tool.
+    Used by the neo4j_neighborhood MCP tool. Bounded BFS with a per-hop
+    fan-out cap, so hub products can't blow up the payload. Repeated calls
+    are served from an LRU+TTL cache (TTL bounds staleness, since graph
+    rebuilds happen in the Streamlit process).
+    """
+    return cached_customer_neighborhood(customer_id, depth=depth, driver=get_neo4j_driver())
+
+
+def get_customer_neighborhoods(customer_ids, depth: int = 2):
+    """
+    Neighborhoods of many customers in one call, as CSR arrays.
+    Used by the neo4j_neighborhoods MCP tool.
     """
-    driver = get_neo4j_driver()
-    with driver.session() as session:
-        result = session.run(
-            """
-            MATCH path = (c:Customer {id: $cid})-[*1..$depth]-(n)
-            RETURN path LIMIT 50
-            """,
-            cid=customer_id,
-            depth=depth,
+    return neighborhoods_to_json(batch_neighborhoods(customer_ids, depth=depth, driver=get_neo4j_driver()))
+
+
+# ========= Tool execution =========
+
+@dataclass
+class ToolSpec:
+    fn: Callable
+    max_concurrency: int   # calls of this tool running at once
+    timeout: float         # seconds before the caller gets a timeout error
+
+    def __post_init__(self):
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+
+def _rag_search_tool(arguments: dict):
+    return cortex_rag_search(
+        question=arguments["question"],
+        limit=arguments.get("limit", 5),
+    )
+
+
+def _analyst_tool(arguments: dict):
+    return cortex_analyst_summarize_sales(arguments["question"])
+
+
+def _neighborhood_tool(arguments: dict):
+    return get_customer_neighborhood(
+        customer_id=arguments["customer_id"],
+        depth=arguments.get("depth", 2),
+    )
+
+
+def _neighborhoods_tool(arguments: dict):
+    return get_customer_neighborhoods(
+        customer_ids=arguments["customer_ids"],
+        depth=arguments.get("depth", 2),
+    )
+
+
+# COMPLETE is slow and expensive, so it gets the fewest slots;
+# neighborhood reads share the Neo4j driver pool.
+TOOLS = {
+    "cortex_rag_search": ToolSpec(_rag_search_tool, max_concurrency=8, timeout=30),
+    "cortex_analyst": ToolSpec(_analyst_tool, max_concurrency=4, timeout=90),
+    "neo4j_neighborhood": ToolSpec(_neighborhood_tool, max_concurrency=8, timeout=20),
+    "neo4j_neighborhoods": ToolSpec(_neighborhoods_tool, max_concurrency=2, timeout=120),
+}
+
+_executor = None
+
+
+def get_tool_executor():
+    # One worker per concurrency slot, so a permitted call never waits for a thread
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=sum(spec.max_concurrency for spec in TOOLS.values()),
+            thread_name_prefix="mcp-tool",
         )
+    return _executor
+
+
+async def run_tool(name: str, arguments: dict):
+    """
+    Run a blocking tool function off the event loop, within the tool's
+    concurrency limit and timeout.
+
+    A worker thread can't be interrupted, so on timeout or cancellation the
+    call keeps its slot until the thread actually finishes; only the result is
+    dropped. That keeps the number of running queries within the limit.
+    """
+    spec = TOOLS.get(name)
+    if spec is None:
+        raise ValueError(f"Unknown tool {name}")
+
+    loop = asyncio.get_running_loop()
+    await spec.semaphore.acquire()
+    try:
+        future = loop.run_in_executor(get_tool_executor(), spec.fn, arguments)
+    except BaseException:
+        spec.semaphore.release()
+        raise
+    future.add_done_callback(lambda _: spec.semaphore.release())
+
+    try:
+        # shield: a timeout/cancel must not mark the future done before the thread is
+        return await asyncio.wait_for(asyncio.shield(future), spec.timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Tool {name} timed out after {spec.timeout}s") from None
+
 
-        nodes = {}
-        rels = []
-
-        for record in result:
-            path = record["path"]
-            for n in path.nodes:
-                nid = n.id
-                if nid not in nodes:
-                    nodes[nid] = {
-                        "id": nid,
-                        "labels": list(n.labels),
-                        "props": dict(n),
-                    }
-            for r in path.relationships:
-                rels.append({
-                    "start": r.start_node.id,
-                    "end": r.end_node.id,
-                    "type": r.type
-                })
-
-    driver.close()
-    return {
-        "nodes": list(nodes.values()),
-        "edges": rels,
-    }
+def shutdown_tool_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
 
 
 # ========= MCP server definition =========
@@ -191,35 +248,42 @@ async def list_tools():
                 "required": ["customer_id"]
             },
         ),
+        Tool(
+            name="neo4j_neighborhoods",
+            description=(
+                "Neighborhoods of many customers from Neo4j KG in one call, as CSR arrays: "
+                "node_ids/node_labels, indptr/indices/edge_types (adjacency) and "
+                "member_indptr/members (nodes per customer)."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "customer_ids": {"type": "array", "items": {"type": "string"}},
+                    "depth": {"type": "integer", "default": 2}
+                },
+                "required": ["customer_ids"]
+            },
+        ),
     ]
 
 
 @server.call_tool()
 async def call_tool(name: str, arguments: dict):
-    if name == "cortex_rag_search":
-        res = cortex_rag_search(
-            question=arguments["question"],
-            limit=arguments.get("limit", 5),
-        )
-        return Result(content=[{"type": "json", "value": res}])
+    res = await run_tool(name, arguments)
 
     if name == "cortex_analyst":
-        ans = cortex_analyst_summarize_sales(arguments["question"])
-        return Result(content=[{"type": "text", "text": ans}])
-
-    if name == "neo4j_neighborhood":
-        g = get_customer_neighborhood(
-            customer_id=arguments["customer_id"],
-            depth=arguments.get("depth", 2),
-        )
-        return Result(content=[{"type": "json", "value": g}])
-
-    raise ValueError(f"Unknown tool {name}")
+        return Result(content=[{"type": "text", "text": res}])
+    return Result(content=[{"type": "json", "value": res}])
 
 
 async def main():
-    async with stdio_server() as (reader, writer):
-        await server.run(reader, writer, initialization_options={})
+    try:
+        async with stdio_server() as (reader, writer):
+            await server.run(reader, writer, initialization_options={})
+    finally:
+        shutdown_tool_executor()
+        close_snowflake_pool()
+        close_neo4j_drivers()
 
 if __name__ == "__main__":
     import asyncio
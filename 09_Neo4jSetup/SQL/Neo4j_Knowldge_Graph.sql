@@ -88,6 +88,13 @@ SELECT * FROM PRODUCT;
 SELECT * FROM STORE;
 SELECT * FROM ORDERS;
 
+-- Change tracking lets the graph sync read only what changed since its last run
+-- (CHANGES clause); the watermark must stay within DATA_RETENTION_TIME_IN_DAYS
+ALTER TABLE CUSTOMER SET CHANGE_TRACKING = TRUE;
+ALTER TABLE PRODUCT  SET CHANGE_TRACKING = TRUE;
+ALTER TABLE STORE    SET CHANGE_TRACKING = TRUE;
+ALTER TABLE ORDERS   SET CHANGE_TRACKING = TRUE;
+
 
 
 -- Customer nodes
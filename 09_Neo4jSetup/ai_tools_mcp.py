@@ -1,11 +1,16 @@
 # This file contains functions that interact with Snowflake and Neo4j databases.
 
 import json
-import os
-import streamlit as st
-from neo4j import GraphDatabase
-from sf_to_neo4j import build_graph_from_snowflake
-from neo4j_utils import get_neo4j_driver
+from snowflake_utils import query_df, query_rows
+from cortex_retrieval import retriever
+from sf_to_neo4j import build_graph_from_snowflake, sync_graph_from_snowflake
+from graph_neighborhood import (
+    DEFAULT_FANOUT,
+    DEFAULT_MAX_NODES,
+    cached_customer_neighborhood,
+    get_customer_neighborhoods as batch_neighborhoods,
+    neighborhood_cache,
+)
 
 
 # ---------- Snowflake sample analytics (optional helper) ----------
@@ -15,99 +20,80 @@ def get_sample_orders(limit: int = 10):
     Simple helper to fetch sample orders from Snowflake.
     Used by the UI to show basic data.
     """
-    conn = st.connection("snowflake")
     sql = f"SELECT * FROM KG_DEMO_DB.PUBLIC.ORDERS LIMIT {limit}"
-    return conn.query(sql)
+    return query_df(sql)
 
 
 # ---------- Snowflake Cortex: RAG search ----------
 
 def cortex_rag_search(question: str, limit: int = 5):
-    conn = st.connection("snowflake")
-    service = "KG_DEMO_DB.PUBLIC.DOCS_SEARCH"
-
-    payload_str = json.dumps({"query": question, "limit": int(limit)}).replace("'", "''")
-
-    sql = f"""
-    SELECT SYSTEM$CORTEX_SEARCH_QUERY(
-      '{service}',
-      '{payload_str}'
-    ) AS RESULT;
     """
+    Doc chunks from Cortex Search, with bound parameters and a cache keyed by
+    the normalized question (see cortex_retrieval.py).
+    """
+    return retriever.search(question, limit)
 
-    df = conn.query(sql)
-    raw = df["RESULT"].iloc[0]
-    res = json.loads(raw) if isinstance(raw, str) else raw
-
-    flat = []
-    for r in res.get("results", []):
-        scores = r.get("@scores", {}) or {}
-
-        # Content can be CONTENT or content depending on service/settings
-        content = r.get("CONTENT") or r.get("content") or ""
-
-        # Best-effort metadata (varies by search service config)
-        title = (
-            r.get("TITLE")
-            or r.get("title")
-            or r.get("DOCUMENT_TITLE")
-            or r.get("document_title")
-            or r.get("SOURCE")
-            or r.get("source")
-            or "Doc chunk"
-        )
-
-        section = (
-            r.get("SECTION")
-            or r.get("section")
-            or r.get("HEADING")
-            or r.get("heading")
-            or r.get("PAGE")
-            or r.get("page")
-            or "N/A"
-        )
-
-        flat.append({
-            "title": title,
-            "section": section,
-            "content": content,
-            "score": float(scores.get("cosine_similarity", 0.0)),
-            "text_match": float(scores.get("text_match", 0.0)),
-            # Optional: keep raw for debugging (remove later)
-            # "raw": r,
-        })
-
-    return flat
+
+def rag_search_stats():
+    """Hit rate and backend query latency of the RAG search cache"""
+    return retriever.info()
 
 
 # ---------- Snowflake Cortex: analyst over tables ----------
 
+ANALYST_MODEL = "snowflake-arctic"
+ANALYST_BATCH_SIZE = 50   # questions per COMPLETE statement
+
+# Shared schema preamble, built once and bound once per statement
+ANALYST_PREAMBLE = (
+    "You are a Snowflake data analyst. "
+    "Database KG_DEMO_DB.PUBLIC has tables CUSTOMER, PRODUCT, STORE, ORDERS. "
+    "ORDERS(ORDER_ID, CUSTOMER_ID, PRODUCT_ID, STORE_ID, ORDER_DATE, QUANTITY, TOTAL_AMOUNT). "
+    "Answer the question based only on this data, and if needed, propose SQL "
+    "(but do not actually run it). "
+    "Be concise and conversational. "
+    "Question: "
+)
+
+ANALYST_SQL = """
+SELECT SNOWFLAKE.CORTEX.COMPLETE(
+  %(model)s,
+  CONCAT(%(preamble)s, %(question)s)
+) AS ANSWER
+"""
+
+# One COMPLETE per array element; FLATTEN's INDEX keeps the input order
+ANALYST_BATCH_SQL = """
+SELECT q.INDEX AS IDX,
+       SNOWFLAKE.CORTEX.COMPLETE(%(model)s, CONCAT(%(preamble)s, q.VALUE::STRING)) AS ANSWER
+FROM TABLE(FLATTEN(INPUT => PARSE_JSON(%(questions)s))) q
+ORDER BY q.INDEX
+"""
+
+
 def cortex_analyst_summarize_sales(question: str) -> str:
-    conn = st.connection("snowflake")
-
-    escaped_q = question.replace("'", "''")
-
-    prompt = (
-        "You are a Snowflake data analyst. "
-        "Database KG_DEMO_DB.PUBLIC has tables CUSTOMER, PRODUCT, STORE, ORDERS. "
-        "ORDERS(ORDER_ID, CUSTOMER_ID, PRODUCT_ID, STORE_ID, ORDER_DATE, QUANTITY, TOTAL_AMOUNT). "
-        "Answer the question based only on this data, and if needed, propose SQL "
-        "(but do not actually run it). "
-        "Be concise and conversational. "
-        f"Question: {escaped_q}"
-    )
-
-    escaped_prompt = prompt.replace("'", "''")
-
-    sql = f"""
-    SELECT SNOWFLAKE.CORTEX.COMPLETE(
-      'snowflake-arctic',
-      '{escaped_prompt}'
-    ) AS ANSWER;
-    """
+    params = {"model": ANALYST_MODEL, "preamble": ANALYST_PREAMBLE, "question": question}
+    return query_rows(ANALYST_SQL, params=params)[0]["ANSWER"]
+
 
-    df = conn.query(sql)
-    return df["ANSWER"].iloc[0]
+def cortex_analyst_batch(questions, batch_size: int = ANALYST_BATCH_SIZE) -> list:
+    """
+    Answer many analyst questions with one set-based COMPLETE statement per
+    batch of questions. Answers come back in the order of `questions`.
+    """
+    questions = list(questions)
+    answers = []
+    for start in range(0, len(questions), batch_size):
+        batch = questions[start:start + batch_size]
+        params = {
+            "model": ANALYST_MODEL,
+            "preamble": ANALYST_PREAMBLE,
+            "questions": json.dumps(batch),
+        }
+        rows = query_rows(ANALYST_BATCH_SQL, params=params)
+        by_index = {row["IDX"]: row["ANSWER"] for row in rows}
+        answers.extend(by_index.get(i) for i in range(len(batch)))
+    return answers
 
 
 # ---------- Neo4j: build graph & neighborhood ----------
@@ -117,43 +103,35 @@ def rebuild_graph_from_snowflake():
     Thin wrapper over sf_to_neo4j.build_graph_from_snowflake()
     so the UI can call a single function.
     """
-    build_graph_from_snowflake()
-
-
-def get_customer_neighborhood(customer_id: str, depth: int = 2):
-    driver = get_neo4j_driver()
-    with driver.session() as session:
-        query = f"""
-        MATCH path = (c:Customer {{id: $cid}})-[*1..{depth}]-(n)
-        RETURN path LIMIT 50
-        """
-        result = session.run(query, cid=customer_id)
-
-
-        nodes = {}
-        edges = []
-
-        for record in result:
-            path = record["path"]
-            for n in path.nodes:
-                nid = str(n.id)   # or n.element_id in newer Neo4j
-                if nid not in nodes:
-                    nodes[nid] = {
-                        "id": nid,
-                        "labels": list(n.labels),
-                        "props": dict(n),
-                    }
-
-            for r in path.relationships:
-                edges.append({
-                    "start": str(r.start_node.id),
-                    "end": str(r.end_node.id),
-                    "type": r.type
-                })
-
-    driver.close()
-    return {
-        "nodes": list(nodes.values()),
-        "edges": edges,
-    }
+    return build_graph_from_snowflake()
+
+
+def sync_graph_changes():
+    """
+    Incremental counterpart of rebuild_graph_from_snowflake(): applies only
+    rows changed since the last load (full rebuild on first run).
+    """
+    return sync_graph_from_snowflake()
+
+
+def get_customer_neighborhood(customer_id: str, depth: int = 2,
+                              fanout: int = DEFAULT_FANOUT, max_nodes: int = DEFAULT_MAX_NODES):
+    """
+    Distinct nodes/relationships around a customer, expanded breadth-first
+    with a per-hop fan-out cap (see graph_neighborhood.py). Results are cached
+    until they expire or a rebuild/sync touches one of their nodes.
+    """
+    return cached_customer_neighborhood(customer_id, depth=depth, fanout=fanout, max_nodes=max_nodes)
+
+
+def get_customer_neighborhoods(customer_ids, depth: int = 2):
+    """
+    Neighborhoods of many customers at once, as CSR-style arrays
+    (see graph_neighborhood.get_customer_neighborhoods).
+    """
+    return batch_neighborhoods(customer_ids, depth=depth)
+
 
+def neighborhood_cache_stats():
+    """Hit/miss/eviction counters and size of the neighborhood cache"""
+    return neighborhood_cache.info()
@@ -1,7 +1,7 @@
 import streamlit as st
 from streamlit_agraph import agraph, Node, Edge, Config
-from sf_to_neo4j import build_graph_from_snowflake
-from neo4j_utils import get_neo4j_driver
+from sf_to_neo4j import build_graph_from_snowflake, sync_graph_from_snowflake
+from graph_viz import community_collapse, node_properties, top_degree_sample
 
 # Updated Streamlit App Configuration
 
@@ -11,6 +11,14 @@ st.title("Snowflake + Neo4j Knowledge Graph PoC")
 
 tab1, tab2 = st.tabs(["Snowflake Analytics", "Neo4j Knowledge Graph"])
 
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_viz_graph(mode: str, max_edges: int):
+    if mode == "Top customers":
+        return top_degree_sample(max_edges)
+    return community_collapse(max_edges)
+
+
 # --- Tab 1 (your existing Snowflake visualizations)
 with tab1:
     sql = "SELECT * FROM KG_DEMO_DB.PUBLIC.ORDERS LIMIT 10"
@@ -22,42 +30,45 @@ with tab1:
 with tab2:
     st.subheader("Build / Refresh Knowledge Graph from Snowflake")
 
-    if st.button("Rebuild Graph in Neo4j"):
-        build_graph_from_snowflake()
-        st.success("Graph successfully rebuilt from Snowflake!")
+    col_rebuild, col_sync = st.columns(2)
+    if col_rebuild.button("Rebuild Graph in Neo4j"):
+        stats = build_graph_from_snowflake()
+        load_viz_graph.clear()
+        st.success(f"Graph successfully rebuilt from Snowflake in {stats['seconds']:.1f}s!")
+        with st.expander("Per-chunk load latency"):
+            st.dataframe(stats["chunks"])
+    if col_sync.button("Sync Changes to Neo4j"):
+        stats = sync_graph_from_snowflake()
+        load_viz_graph.clear()
+        st.success(
+            f"Graph {stats['mode']} sync done in {stats['seconds']:.1f}s: "
+            f"{sum(stats['upserted'].values())} upserts, {sum(stats['deleted'].values())} deletes"
+        )
+        with st.expander("Per-chunk load latency"):
+            st.dataframe(stats["chunks"])
 
     st.subheader("Graph Visualization")
 
-    limit = st.slider("Max relationships to display", 10, 200, 50)
-
-    driver = get_neo4j_driver()
-
-    with driver.session() as session:
-        result = session.run("""
-            MATCH (c:Customer)-[:BOUGHT]->(p:Product)
-            RETURN c, p
-            LIMIT $limit
-        """, limit=limit)
-
-        nodes_dict = {}
-        edges = []
-
-        for record in result:
-            c = record["c"]
-            p = record["p"]
-
-            c_id = str(c.id)
-            p_id = str(p.id)
-
-            if c_id not in nodes_dict:
-                nodes_dict[c_id] = Node(id=c_id, label=c.get("name", c_id), title=str(dict(c)), size=20)
-
-            if p_id not in nodes_dict:
-                nodes_dict[p_id] = Node(id=p_id, label=p.get("name", p_id), title=str(dict(p)), size=20)
-
-            edges.append(Edge(source=c_id, target=p_id, label="BOUGHT"))
-
-    driver.close()
-
-    config = Config(width=1200, height=700, directed=True, physics=True)
-    agraph(list(nodes_dict.values()), edges, config)
+    mode = st.radio("View", ["Top customers", "Cities x categories"], horizontal=True)
+    limit = st.slider("Max relationships to display", 10, 500, 50)
+
+    # Sampled/aggregated in Cypher; only ids, captions and sizes reach the browser
+    graph = load_viz_graph(mode, limit)
+
+    nodes = [
+        Node(id=n["id"], label=n["caption"], title=n["id"], size=n["size"], group=n["group"])
+        for n in graph["nodes"]
+    ]
+    edges = [Edge(source=e["source"], target=e["target"], label=e["type"]) for e in graph["edges"]]
+
+    col_graph, col_props = st.columns([3, 1])
+    with col_graph:
+        config = Config(width=900, height=700, directed=True, physics=True)
+        selected = agraph(nodes, edges, config)
+    with col_props:
+        st.markdown("**Node details**")
+        if selected:
+            st.caption(selected)
+            st.json(node_properties(selected) or {})
+        else:
+            st.caption("Click a node to load its properties.")
@@ -11,12 +11,24 @@ from ai_tools_mcp import (
     cortex_analyst_summarize_sales,
     cortex_rag_search,
     rebuild_graph_from_snowflake,
+    sync_graph_changes,
     get_customer_neighborhood,
+    get_customer_neighborhoods,
+    neighborhood_cache_stats,
+    rag_search_stats,
 )
+from copilot import run_copilot
 
 st.set_page_config(page_title="Snowflake + Neo4j + Cortex PoC", layout="wide")
 st.title("Snowflake + Neo4j + Cortex PoC")
 
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_neighborhoods(customer_ids: tuple, depth: int):
+    # Cleared after a rebuild/sync; the TTL covers loads made from other processes
+    return get_customer_neighborhoods(list(customer_ids), depth=depth)
+
+
 tab1, tab2, tab3 = st.tabs([
     "Snowflake Analytics",
     "Neo4j Knowledge Graph",
@@ -34,38 +46,58 @@ with tab1:
 with tab2:
     st.subheader("Build / Refresh Knowledge Graph from Snowflake")
 
-    if st.button("Rebuild Graph in Neo4j"):
-        rebuild_graph_from_snowflake()
-        st.success("Graph successfully rebuilt from Snowflake!")
+    col_rebuild, col_sync = st.columns(2)
+    if col_rebuild.button("Rebuild Graph in Neo4j"):
+        stats = rebuild_graph_from_snowflake()
+        load_neighborhoods.clear()
+        st.success(f"Graph successfully rebuilt from Snowflake in {stats['seconds']:.1f}s!")
+        with st.expander("Per-chunk load latency"):
+            st.dataframe(stats["chunks"])
+    if col_sync.button("Sync Changes to Neo4j"):
+        stats = sync_graph_changes()
+        load_neighborhoods.clear()
+        st.success(
+            f"Graph {stats['mode']} sync done in {stats['seconds']:.1f}s: "
+            f"{sum(stats['upserted'].values())} upserts, {sum(stats['deleted'].values())} deletes"
+        )
+        with st.expander("Per-chunk load latency"):
+            st.dataframe(stats["chunks"])
 
     st.subheader("Graph Visualization")
 
+    customer_ids = st.text_input("Customer IDs (comma-separated)", value="C001", key="viz_customers")
     limit = st.slider("Max relationships to display", 10, 200, 50)
 
-    graph = get_customer_neighborhood(customer_id="C001", depth=2)  # or use LIMIT logic
+    ids = tuple(dict.fromkeys(c.strip() for c in customer_ids.split(",") if c.strip()))
+    graph = load_neighborhoods(ids, depth=2)
 
-    # Convert graph dict → agraph nodes/edges
+    # Convert CSR arrays → agraph nodes/edges, up to `limit` relationships
     nodes_dict = {}
     edges = []
 
-    for n in graph["nodes"]:
-        nid = n["id"]
-        label = n["props"].get("name", nid)
-        nodes_dict[nid] = Node(
-            id=nid,
-            label=label,
-            title=str(n["props"]),
-            size=20,
-        )
-
-    for e in graph["edges"]:
-        edges.append(
-            Edge(
-                source=e["start"],
-                target=e["end"],
-                label=e["type"],
+    def add_node(i):
+        key = f"{graph['node_labels'][i]}:{graph['node_ids'][i]}"
+        if key not in nodes_dict:
+            nodes_dict[key] = Node(id=key, label=str(graph["node_ids"][i]), title=key, size=20)
+        return key
+
+    indptr, indices = graph["indptr"], graph["indices"]
+    for src in range(len(graph["node_ids"])):
+        if len(edges) >= limit:
+            break
+        for k in range(indptr[src], indptr[src + 1]):
+            if len(edges) >= limit:
+                break
+            edges.append(
+                Edge(
+                    source=add_node(src),
+                    target=add_node(indices[k]),
+                    label=graph["rel_types"][graph["edge_types"][k]],
+                )
             )
-        )
+    missing = [c for c, root in zip(graph["customers"], graph["roots"]) if root < 0]
+    if missing:
+        st.warning(f"Customers not in the graph: {', '.join(missing)}")
 
     config = Config(width=1200, height=700, directed=True, physics=True)
     agraph(list(nodes_dict.values()), edges, config)
@@ -94,10 +126,40 @@ with tab3:
             st.write(c["content"])
             st.markdown("---")
 
+    rag = rag_search_stats()
+    st.caption(
+        f"Search cache: hit rate {rag['hit_rate']:.0%} ({rag['hits']} hits / {rag['misses']} misses), "
+        f"Cortex Search latency avg {rag['avg_ms']:.0f}ms, p95 {rag['p95_ms']:.0f}ms"
+    )
+
     st.markdown("---")
     st.markdown("### 3. Neo4j Neighborhood")
     cid = st.text_input("Customer ID for neighborhood:", value="C001", key="cid")
     depth = st.slider("Depth", 1, 3, 2, key="depth_slider")
+    fanout = st.slider("Max relationships per node per hop", 5, 100, 25, key="fanout_slider")
     if st.button("Get Neighborhood", key="btn_graph"):
-        g = get_customer_neighborhood(cid, depth=depth)
+        g = get_customer_neighborhood(cid, depth=depth, fanout=fanout)
         st.json(g)
+
+    cache = neighborhood_cache_stats()
+    st.caption(
+        f"Neighborhood cache: {cache['size']} entries, hit rate {cache['hit_rate']:.0%} "
+        f"({cache['hits']} hits / {cache['misses']} misses), "
+        f"{cache['evictions']} evicted, {cache['expirations']} expired, "
+        f"{cache['invalidations']} invalidated by graph loads"
+    )
+
+    st.markdown("---")
+    st.markdown("### 4. Combined Copilot (Docs + Graph + Tables)")
+    q4 = st.text_input("Ask anything:", key="q4")
+    cid4 = st.text_input("Customer ID for graph context (optional):", value="", key="cid4")
+    budget = st.slider("Context token budget", 500, 8000, 2000, step=500, key="budget")
+    if st.button("Ask Copilot", key="btn_copilot") and q4:
+        out = run_copilot(q4, customer_id=cid4.strip() or None, doc_limit=limit_docs, token_budget=budget)
+        st.caption(
+            f"Done in {out['seconds']:.1f}s (slowest source), ~{out['tokens']} context tokens; "
+            + ", ".join(f"{k} {v:.1f}s" for k, v in out["timings"].items())
+        )
+        for name, err in out["errors"].items():
+            st.warning(f"{name}: {err}")
+        st.markdown(out["context"])
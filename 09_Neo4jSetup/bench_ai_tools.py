@@ -0,0 +1,53 @@
+## Benchmark: Cortex analyst questions one at a time vs batched.
+## Sends the same questions through cortex_analyst_summarize_sales() (one
+## COMPLETE statement per question) and cortex_analyst_batch() (one
+## statement per batch over a FLATTENed array), and prints throughput.
+##
+## Command: python bench_ai_tools.py --questions 40 --batch-size 20
+
+import argparse
+import time
+
+from ai_tools_mcp import cortex_analyst_batch, cortex_analyst_summarize_sales
+
+SAMPLE_QUESTIONS = [
+    "Which store has the highest total sales?",
+    "Who are the top 5 customers by order count?",
+    "What is the average order value per product category?",
+    "Which products are most often bought together?",
+    "How did monthly revenue change over the last year?",
+    "Which city has the most customers?",
+    "What share of orders has a quantity above 3?",
+    "Which region generates the most revenue per store?",
+]
+
+
+def make_questions(n: int) -> list:
+    # Suffix keeps prompts distinct, so nothing can be served from a result cache
+    return [f"{SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)]} (#{i})" for i in range(n)]
+
+
+def report(name: str, seconds: float, n: int):
+    print(f"{name:<14} {seconds:>8.2f}s  {n / seconds:>6.2f} questions/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One-at-a-time vs batched Cortex COMPLETE")
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+    questions = make_questions(args.questions)
+
+    start = time.perf_counter()
+    single = [cortex_analyst_summarize_sales(q) for q in questions]
+    report("one at a time", time.perf_counter() - start, len(questions))
+
+    start = time.perf_counter()
+    batched = cortex_analyst_batch(questions, batch_size=args.batch_size)
+    report("batched", time.perf_counter() - start, len(questions))
+
+    assert len(batched) == len(single) and all(a is not None for a in batched)
+
+
+if __name__ == "__main__":
+    main()
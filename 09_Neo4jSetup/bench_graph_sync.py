@@ -0,0 +1,132 @@
+## Benchmark: full graph rebuild vs incremental sync on generated data.
+## Inserts synthetic customers/products/stores/orders (ids prefixed GEN_) into
+## KG_DEMO_DB.PUBLIC, times a full rebuild, applies a small change batch
+## (updates, new orders, deleted orders), then times the incremental sync
+## against a second full rebuild. Generated rows are removed at the end.
+## --compare-schema first times a full rebuild with the Neo4j constraints
+## dropped, to show the cost of label scans in MERGE/MATCH.
+##
+## Command: python bench_graph_sync.py --customers 20000 --orders 200000 --change-pct 1
+
+import argparse
+
+from neo4j_utils import get_neo4j_driver
+from snowflake_utils import execute
+from sf_to_neo4j import (
+    SF_SCHEMA,
+    NODE_SPECS,
+    build_graph_from_snowflake,
+    sync_graph_from_snowflake,
+)
+
+
+def run_sql(sql: str):
+    execute(sql)
+
+
+def seq(n: int) -> str:
+    # ROW_NUMBER over a generator gives a stable 1..n sequence per row
+    return f"(SELECT ROW_NUMBER() OVER (ORDER BY SEQ4()) AS I FROM TABLE(GENERATOR(ROWCOUNT => {n})))"
+
+
+def generate_data(customers: int, products: int, stores: int, orders: int):
+    run_sql(f"""
+        INSERT INTO {SF_SCHEMA}.CUSTOMER (CUSTOMER_ID, CUSTOMER_NAME, EMAIL, CITY)
+        SELECT 'GEN_C' || I, 'Customer ' || I, 'c' || I || '@example.com', 'City ' || MOD(I, 50)
+        FROM {seq(customers)}
+    """)
+    run_sql(f"""
+        INSERT INTO {SF_SCHEMA}.PRODUCT (PRODUCT_ID, PRODUCT_NAME, CATEGORY, PRICE)
+        SELECT 'GEN_P' || I, 'Product ' || I, 'Category ' || MOD(I, 20), UNIFORM(1, 500, RANDOM())
+        FROM {seq(products)}
+    """)
+    run_sql(f"""
+        INSERT INTO {SF_SCHEMA}.STORE (STORE_ID, STORE_NAME, CITY, REGION)
+        SELECT 'GEN_S' || I, 'Store ' || I, 'City ' || MOD(I, 50), 'Region ' || MOD(I, 5)
+        FROM {seq(stores)}
+    """)
+    insert_orders("GEN_O", orders, customers, products, stores)
+
+
+def insert_orders(prefix: str, orders: int, customers: int, products: int, stores: int):
+    run_sql(f"""
+        INSERT INTO {SF_SCHEMA}.ORDERS
+            (ORDER_ID, CUSTOMER_ID, PRODUCT_ID, STORE_ID, ORDER_DATE, QUANTITY, TOTAL_AMOUNT)
+        SELECT '{prefix}' || I,
+               'GEN_C' || UNIFORM(1, {customers}, RANDOM()),
+               'GEN_P' || UNIFORM(1, {products}, RANDOM()),
+               'GEN_S' || UNIFORM(1, {stores}, RANDOM()),
+               DATEADD(MINUTE, -I, CURRENT_TIMESTAMP()),
+               UNIFORM(1, 5, RANDOM()),
+               UNIFORM(1, 500, RANDOM())
+        FROM {seq(orders)}
+    """)
+
+
+def apply_changes(pct: float, orders: int, customers: int, products: int, stores: int):
+    run_sql(f"""
+        UPDATE {SF_SCHEMA}.CUSTOMER SET CITY = 'Relocated'
+        WHERE CUSTOMER_ID LIKE 'GEN_C%' AND UNIFORM(0::FLOAT, 100::FLOAT, RANDOM()) < {pct}
+    """)
+    insert_orders("GEN_N", max(1, int(orders * pct / 100)), customers, products, stores)
+    run_sql(f"""
+        DELETE FROM {SF_SCHEMA}.ORDERS
+        WHERE ORDER_ID LIKE 'GEN_O%' AND UNIFORM(0::FLOAT, 100::FLOAT, RANDOM()) < {pct}
+    """)
+
+
+def cleanup():
+    run_sql(f"DELETE FROM {SF_SCHEMA}.ORDERS WHERE ORDER_ID LIKE 'GEN_%'")
+    run_sql(f"DELETE FROM {SF_SCHEMA}.CUSTOMER WHERE CUSTOMER_ID LIKE 'GEN_%'")
+    run_sql(f"DELETE FROM {SF_SCHEMA}.PRODUCT WHERE PRODUCT_ID LIKE 'GEN_%'")
+    run_sql(f"DELETE FROM {SF_SCHEMA}.STORE WHERE STORE_ID LIKE 'GEN_%'")
+
+
+def drop_graph_schema():
+    driver = get_neo4j_driver()
+    with driver.session() as session:
+        for spec in NODE_SPECS:
+            session.run(f"DROP CONSTRAINT {spec['label'].lower()}_{spec['node_key']}_unique IF EXISTS").consume()
+
+
+def report(name: str, stats: dict):
+    print(
+        f"{name:<24} {stats['mode']:<12} {stats['seconds']:>8.2f}s  "
+        f"upserts={sum(stats['upserted'].values()):<8} deletes={sum(stats['deleted'].values())}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full rebuild vs incremental graph sync")
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--stores", type=int, default=50)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--change-pct", type=float, default=1.0)
+    parser.add_argument("--keep", action="store_true", help="keep generated rows")
+    parser.add_argument("--compare-schema", action="store_true",
+                        help="also time a full rebuild without constraints/indexes")
+    args = parser.parse_args()
+    sizes = (args.customers, args.products, args.stores)
+
+    generate_data(*sizes, args.orders)
+    try:
+        if args.compare_schema:
+            drop_graph_schema()
+            report("rebuild, no constraints", build_graph_from_snowflake(with_schema=False))
+
+        report("initial full rebuild", build_graph_from_snowflake())
+
+        apply_changes(args.change_pct, args.orders, *sizes)
+        report("incremental sync", sync_graph_from_snowflake())
+
+        # Same end state, rebuilt from scratch, for comparison
+        report("full rebuild (same data)", build_graph_from_snowflake())
+    finally:
+        if not args.keep:
+            cleanup()
+            sync_graph_from_snowflake()
+
+
+if __name__ == "__main__":
+    main()
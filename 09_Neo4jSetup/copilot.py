@@ -0,0 +1,134 @@
+## Combined copilot pipeline: one question, three sources in parallel.
+## Doc retrieval (Cortex Search), graph expansion (Neo4j neighborhood) and the
+## table summary (Cortex Analyst) run concurrently, so the end-to-end latency
+## is that of the slowest call (capped by a deadline), not the sum. Their
+## outputs are deduplicated and fused into one context that fits a token budget.
+
+import hashlib
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from ai_tools_mcp import cortex_analyst_summarize_sales, get_customer_neighborhood
+from cortex_retrieval import retriever
+
+TOKEN_BUDGET = 2000    # approximate tokens in the fused context
+DEADLINE = 60          # seconds to wait for the slowest source
+CHARS_PER_TOKEN = 4    # rough estimate, good enough for budgeting
+
+_executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix="copilot")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _fingerprint(text: str) -> str:
+    # Whitespace/case-insensitive, so re-chunked copies of a passage collapse
+    return hashlib.sha1(re.sub(r"\s+", " ", text).strip().lower().encode()).hexdigest()
+
+
+def graph_facts(graph: dict) -> list:
+    """Neighborhood subgraph -> one "Label id -TYPE-> Label id" line per distinct relationship"""
+    names = {
+        n["id"]: f"{n['labels'][0] if n['labels'] else 'Node'} {n['props'].get('id', n['id'])}"
+        for n in graph["nodes"]
+    }
+    facts = []
+    for e in graph["edges"]:
+        start, end = names.get(e["start"]), names.get(e["end"])
+        if start and end:
+            facts.append(f"{start} -{e['type']}-> {end}")
+    return list(dict.fromkeys(facts))
+
+
+def fuse_context(analyst: str, chunks: list, facts: list, token_budget: int = TOKEN_BUDGET):
+    """
+    Fill the budget in priority order: analyst summary, doc chunks (best score
+    first, duplicates dropped), then graph facts. Returns (context, used_tokens).
+    """
+    parts, used = [], 0
+
+    def add(text):
+        nonlocal used
+        cost = estimate_tokens(text)
+        if used + cost > token_budget:
+            return False
+        parts.append(text)
+        used += cost
+        return True
+
+    def add_section(title, items):
+        # The heading only goes in together with its first item
+        if not items or not add(f"{title}\n{items[0]}"):
+            return
+        for item in items[1:]:
+            if not add(item):
+                break
+
+    if analyst:
+        add(f"## Table summary\n{analyst}")
+
+    seen = set()
+    docs = []
+    for c in sorted(chunks, key=lambda c: c["score"], reverse=True):
+        fp = _fingerprint(c["content"])
+        if not c["content"] or fp in seen:
+            continue
+        seen.add(fp)
+        docs.append(f"[{c['title']} / {c['section']}] {c['content']}")
+    add_section("## Documents", docs)
+    add_section("## Customer graph", facts)
+
+    return "\n\n".join(parts), used
+
+
+def run_copilot(question: str, customer_id: str = None, doc_limit: int = 5,
+                depth: int = 1, token_budget: int = TOKEN_BUDGET, deadline: float = DEADLINE):
+    """
+    Fire all sources at once and fuse whatever finished before the deadline.
+    A failed or late source is reported in "errors" and left out of the context.
+    """
+    start = time.perf_counter()
+    timings = {}
+
+    def timed(name, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings[name] = time.perf_counter() - t0
+
+    futures = {
+        "docs": _executor.submit(timed, "docs", retriever.search, question, doc_limit),
+        "analyst": _executor.submit(timed, "analyst", cortex_analyst_summarize_sales, question),
+    }
+    if customer_id:
+        futures["graph"] = _executor.submit(
+            timed, "graph", get_customer_neighborhood, customer_id, depth=depth
+        )
+    wait(futures.values(), timeout=deadline)
+
+    results, errors = {}, {}
+    for name, future in futures.items():
+        if not future.done():
+            errors[name] = f"no answer within {deadline}s"
+        elif future.exception() is not None:
+            errors[name] = str(future.exception())
+        else:
+            results[name] = future.result()
+
+    chunks = results.get("docs", [])
+    facts = graph_facts(results["graph"]) if "graph" in results else []
+    context, used = fuse_context(results.get("analyst", ""), chunks, facts, token_budget)
+
+    return {
+        "context": context,
+        "tokens": used,
+        "analyst": results.get("analyst"),
+        "chunks": chunks,
+        "facts": facts,
+        "errors": errors,
+        "timings": dict(timings),   # late sources may still be writing
+        "seconds": time.perf_counter() - start,
+    }
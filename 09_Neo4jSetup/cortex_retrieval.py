@@ -0,0 +1,167 @@
+## Cortex Search retrieval for the copilot (docs RAG).
+## Queries go through SYSTEM$CORTEX_SEARCH_QUERY with bound parameters, and
+## results are cached per (service, normalized question): a request for fewer
+## chunks than a cached result holds is served by slicing it, and misses fetch
+## at least PREFETCH_LIMIT chunks so moving the "Number of doc chunks" slider
+## doesn't re-query. The search backend is injectable, so the retriever can be
+## exercised with a fake backend instead of Snowflake.
+## This is the one cortex_rag_search implementation: ai_tools_mcp.py, the MCP
+## server and MCP/cortex_tools_4_backup.py all delegate here. Result fields are
+## resolved per row, through a field map compiled once per set of columns.
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from snowflake_utils import query_rows
+
+SEARCH_SERVICE = "KG_DEMO_DB.PUBLIC.DOCS_SEARCH"
+
+PREFETCH_LIMIT = 10   # minimum chunks fetched per search
+CACHE_SIZE = 512      # questions kept per process
+CACHE_TTL = 600       # seconds; the docs index refreshes on its own schedule
+
+SEARCH_SQL = "SELECT SYSTEM$CORTEX_SEARCH_QUERY(%(service)s, %(payload)s) AS RESULT"
+
+# Output field -> candidate column names, in order of preference
+FIELD_ALIASES = {
+    "doc_id": ("DOC_ID", "doc_id", "ID", "id"),
+    "title": ("TITLE", "title", "DOCUMENT_TITLE", "document_title", "SOURCE", "source"),
+    "section": ("SECTION", "section", "HEADING", "heading", "PAGE", "page"),
+    "content": ("CONTENT", "content", "CHUNK", "chunk", "TEXT", "text"),
+}
+FIELD_DEFAULTS = {"doc_id": None, "title": "Doc chunk", "section": "N/A", "content": ""}
+
+
+# ---------- Backends ----------
+# backend(service, question, limit) -> raw "results" array
+
+def snowflake_search_backend(service: str, question: str, limit: int) -> list:
+    """SYSTEM$CORTEX_SEARCH_QUERY (works on accounts that reject SEARCH_PREVIEW payloads)"""
+    payload = json.dumps({"query": question, "limit": int(limit)})
+    raw = query_rows(SEARCH_SQL, params={"service": service, "payload": payload})[0]["RESULT"]
+    res = json.loads(raw) if isinstance(raw, str) else raw
+    return res.get("results", [])
+
+
+def normalize_question(question: str) -> str:
+    """Cache key form of a question: case, spacing and trailing punctuation ignored"""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!.").strip().lower()
+
+
+def compile_field_map(columns) -> dict:
+    """Output field -> the column that supplies it (None if the schema has none)"""
+    columns = set(columns)
+    return {
+        field: next((c for c in aliases if c in columns), None)
+        for field, aliases in FIELD_ALIASES.items()
+    }
+
+
+def result_scores(r: dict):
+    """(score, text_match); score is cosine similarity, or "score" on older result shapes"""
+    scores = r.get("@scores") or {}
+    score = scores.get("cosine_similarity", r.get("score"))
+    return float(score or 0.0), float(scores.get("text_match") or 0.0)
+
+
+class CortexRetriever:
+    """
+    Cached Cortex Search client.
+
+    backend(service, question, limit) returns the raw results list; it
+    defaults to Snowflake. Cached results are shared between callers: treat
+    them as read-only.
+    """
+
+    def __init__(self, backend=None, service: str = SEARCH_SERVICE,
+                 maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+                 prefetch: int = PREFETCH_LIMIT):
+        self.backend = backend or snowflake_search_backend
+        self.service = service
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.prefetch = prefetch
+        self._entries = OrderedDict()   # normalized question -> (expires_at, fetched_limit, results)
+        self._field_maps = {}           # frozenset(record columns) -> compiled field map
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=200)   # seconds per backend query
+        self.stats = {"hits": 0, "misses": 0, "queries": 0}
+
+    def search(self, question: str, limit: int = 5) -> list:
+        key = normalize_question(question)
+        limit = int(limit)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                _, fetched, results = entry
+                # A short result means the index had no more matches
+                if fetched >= limit or len(results) < fetched:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return results[:limit]
+            self.stats["misses"] += 1
+
+        fetch = max(limit, self.prefetch)
+        results = [self.flatten(r) for r in self._query(question, fetch)]
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, fetch, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return results[:limit]
+
+    def flatten(self, r: dict) -> dict:
+        record = r.get("record", r)
+        fields = self._field_map(record)
+        out = {
+            field: (record.get(column) if column else None) or FIELD_DEFAULTS[field]
+            for field, column in fields.items()
+        }
+        out["score"], out["text_match"] = result_scores(r)
+        return out
+
+    def _field_map(self, record: dict) -> dict:
+        # Compiled once per result schema and reused across queries
+        columns = frozenset(record)
+        fields = self._field_maps.get(columns)
+        if fields is None:
+            fields = self._field_maps[columns] = compile_field_map(columns)
+        return fields
+
+    def _query(self, question: str, limit: int) -> list:
+        start = time.perf_counter()
+        raw = self.backend(self.service, question, int(limit))
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats["queries"] += 1
+            self._latencies.append(elapsed)
+        return raw
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            latencies = sorted(self._latencies)
+            return {
+                **self.stats,
+                "size": len(self._entries),
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "avg_ms": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+                "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+            }
+
+
+retriever = CortexRetriever()
+
+
+def cortex_rag_search(question: str, limit: int = 5) -> list:
+    """Top `limit` doc chunks for a question, through the process-wide retriever"""
+    return retriever.search(question, limit)
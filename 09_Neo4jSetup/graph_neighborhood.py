@@ -0,0 +1,338 @@
+## Bounded neighborhood traversal around a customer in the Neo4j KG.
+## Expands hop by hop (BFS) instead of enumerating variable-length paths: each
+## hop is one query over the current frontier, every node contributes at most
+## `fanout` relationships, and the result stops growing at `max_nodes`.
+## Nodes and relationships are deduplicated by element id, so the payload
+## stays bounded even at depth 3 around hub products.
+## cached_customer_neighborhood() puts an LRU+TTL cache in front of it; the
+## graph loader invalidates entries that contain nodes it touched.
+## get_customer_neighborhoods() is the batched variant for analytics: one
+## UNWIND $ids query per chunk of customers, returned as CSR-style arrays.
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from neo4j_utils import get_neo4j_driver
+
+DEFAULT_FANOUT = 25       # relationships expanded per node per hop
+DEFAULT_MAX_NODES = 500   # hard cap on nodes returned
+
+BATCH_FANOUT = 10         # per-hop fan-out for batched neighborhoods
+BATCH_CHUNK_SIZE = 500    # customers per batched query
+
+CACHE_SIZE = 256          # neighborhoods kept per process
+CACHE_TTL = 300           # seconds before an entry is re-queried anyway
+
+ROOT_QUERY = "MATCH (c:Customer {id: $cid}) RETURN c"
+
+HOP_QUERY = """
+UNWIND $frontier AS nid
+MATCH (n) WHERE elementId(n) = nid
+CALL {
+    WITH n
+    MATCH (n)-[r]-(m)
+    RETURN r, m
+    LIMIT $fanout
+}
+RETURN r, m
+"""
+
+
+def _node(n):
+    return {
+        "id": n.element_id,
+        "labels": list(n.labels),
+        "props": dict(n),
+    }
+
+
+def get_customer_neighborhood(customer_id: str, depth: int = 2,
+                              fanout: int = DEFAULT_FANOUT,
+                              max_nodes: int = DEFAULT_MAX_NODES,
+                              driver=None):
+    """
+    Distinct nodes and relationships within `depth` hops of a customer.
+    Returns {"nodes": [...], "edges": [...], "truncated": bool}; truncated is
+    True when the node cap stopped the expansion early.
+    """
+    driver = driver or get_neo4j_driver()
+    nodes = {}
+    edges = {}
+    truncated = False
+
+    with driver.session() as session:
+        root = session.execute_read(lambda tx: tx.run(ROOT_QUERY, cid=customer_id).single())
+        if root is None:
+            return {"nodes": [], "edges": [], "truncated": False}
+
+        c = root["c"]
+        nodes[c.element_id] = _node(c)
+        frontier = [c.element_id]
+
+        for _ in range(depth):
+            if not frontier:
+                break
+            records = session.execute_read(
+                lambda tx: list(tx.run(HOP_QUERY, frontier=frontier, fanout=fanout))
+            )
+
+            next_frontier = []
+            for record in records:
+                r, m = record["r"], record["m"]
+                if m.element_id not in nodes:
+                    if len(nodes) >= max_nodes:
+                        truncated = True
+                        continue
+                    nodes[m.element_id] = _node(m)
+                    next_frontier.append(m.element_id)
+
+                # Only keep edges whose endpoints are both in the result
+                if r.element_id not in edges:
+                    edges[r.element_id] = {
+                        "start": r.start_node.element_id,
+                        "end": r.end_node.element_id,
+                        "type": r.type,
+                    }
+            frontier = next_frontier
+
+    return {
+        "nodes": list(nodes.values()),
+        "edges": list(edges.values()),
+        "truncated": truncated,
+    }
+
+
+# ---------- Batched neighborhoods ----------
+
+def batch_neighborhood_query(depth: int) -> str:
+    """
+    Per-customer BFS in a single statement: each hop expands the previous
+    frontier (at most $fanout relationships per node) and skips seen nodes.
+    """
+    hop = """
+    CALL {
+        WITH frontier
+        UNWIND frontier AS n
+        CALL {
+            WITH n
+            MATCH (n)-[r]-(m)
+            RETURN r, m
+            LIMIT $fanout
+        }
+        RETURN collect(DISTINCT r) AS hop_rels, collect(DISTINCT m) AS hop_nodes
+    }
+    WITH c, seen, rels + hop_rels AS rels, [m IN hop_nodes WHERE NOT m IN seen] AS frontier
+    WITH c, rels, frontier, seen + frontier AS seen
+    """
+    return (
+        """
+    UNWIND $ids AS cid
+    MATCH (c:Customer {id: cid})
+    WITH c, [c] AS frontier, [c] AS seen, [] AS rels
+    """
+        + hop * depth
+        + """
+    RETURN c.id AS cid,
+           [n IN seen | [elementId(n), labels(n)[0], n.id]] AS nodes,
+           [r IN rels | [elementId(startNode(r)), type(r), elementId(endNode(r))]] AS edges
+    """
+    )
+
+
+def get_customer_neighborhoods(customer_ids, depth: int = 2,
+                               fanout: int = BATCH_FANOUT,
+                               chunk_size: int = BATCH_CHUNK_SIZE,
+                               driver=None):
+    """
+    Neighborhoods of many customers, as one shared graph in CSR form:
+
+      node_ids, node_labels        business id and label of every node
+      indptr, indices, edge_types  out-edges of node i are
+                                   indices[indptr[i]:indptr[i + 1]], with
+                                   rel_types[edge_types[k]] as the type
+      customers, roots             requested ids and their node index (-1 if missing)
+      member_indptr, members       node indexes in each customer's neighborhood
+    """
+    driver = driver or get_neo4j_driver()
+    customer_ids = list(customer_ids)
+    query = batch_neighborhood_query(depth)
+
+    index = {}                  # elementId -> node index
+    node_ids, node_labels = [], []
+    edge_set = set()            # (src, type code, dst)
+    rel_types, rel_codes = [], {}
+    found = {}                  # customer id -> member node indexes
+
+    with driver.session() as session:
+        for start in range(0, len(customer_ids), chunk_size):
+            chunk = customer_ids[start:start + chunk_size]
+            records = session.execute_read(
+                lambda tx: list(tx.run(query, ids=chunk, fanout=fanout))
+            )
+            for record in records:
+                members = []
+                for element_id, label, node_id in record["nodes"]:
+                    i = index.get(element_id)
+                    if i is None:
+                        i = index[element_id] = len(node_ids)
+                        node_ids.append(node_id)
+                        node_labels.append(label)
+                    members.append(i)
+                found[record["cid"]] = members
+
+                for src, rel_type, dst in record["edges"]:
+                    code = rel_codes.get(rel_type)
+                    if code is None:
+                        code = rel_codes[rel_type] = len(rel_types)
+                        rel_types.append(rel_type)
+                    edge_set.add((index[src], code, index[dst]))
+
+    edges = np.array(sorted(edge_set), dtype=np.int32).reshape(-1, 3)
+    indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edges[:, 0], minlength=len(node_ids)), out=indptr[1:])
+
+    # The root is always the first member of its own neighborhood
+    member_lists = [found.get(cid, []) for cid in customer_ids]
+    member_indptr = np.zeros(len(customer_ids) + 1, dtype=np.int64)
+    np.cumsum([len(m) for m in member_lists], out=member_indptr[1:])
+
+    return {
+        "node_ids": node_ids,
+        "node_labels": node_labels,
+        "rel_types": rel_types,
+        "indptr": indptr,
+        "indices": edges[:, 2].copy(),
+        "edge_types": edges[:, 1].copy(),
+        "customers": customer_ids,
+        "roots": np.array([m[0] if m else -1 for m in member_lists], dtype=np.int32),
+        "member_indptr": member_indptr,
+        "members": np.array([i for m in member_lists for i in m], dtype=np.int32),
+    }
+
+
+def neighborhoods_to_json(batch: dict) -> dict:
+    """get_customer_neighborhoods() result with plain lists (for MCP / st.json)"""
+    return {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in batch.items()}
+
+
+# ---------- Cache ----------
+
+class NeighborhoodCache:
+    """
+    LRU + TTL cache of neighborhood subgraphs keyed by
+    (customer_id, depth, fanout, max_nodes).
+
+    Every entry remembers the (label, id) of the nodes it contains, so a sync
+    that touched some nodes only drops the neighborhoods those nodes appear in.
+    Cached results are shared between callers: treat them as read-only.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> (expires_at, result)
+        self._members = {}              # (label, id) -> set of keys
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; results fetched before it are not stored
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key, result, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return  # the graph changed while this result was being fetched
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            # The root customer is always a member, even if it wasn't found
+            members = {("Customer", key[0])}
+            for n in result["nodes"]:
+                node_id = n["props"].get("id")
+                for label in n["labels"]:
+                    members.add((label, node_id))
+            for member in members:
+                self._members.setdefault(member, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate(self, touched=None):
+        """
+        Drop entries containing any touched node; touched maps label -> ids,
+        as returned by the graph sync. None (full rebuild) clears everything.
+        """
+        with self._lock:
+            if touched is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                self._members.clear()
+            else:
+                keys = set()
+                for label, ids in touched.items():
+                    for node_id in ids:
+                        keys |= self._members.get((label, node_id), set())
+                for key in keys:
+                    self._drop(key)
+                dropped = len(keys)
+            self.generation += 1
+            self.stats["invalidations"] += dropped
+            return dropped
+
+    def info(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "size": len(self._entries),
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            }
+
+    def _drop(self, key):
+        # Caller holds the lock
+        _, result = self._entries.pop(key)
+        for n in result["nodes"]:
+            for label in n["labels"]:
+                self._discard_member((label, n["props"].get("id")), key)
+        self._discard_member(("Customer", key[0]), key)
+
+    def _discard_member(self, member, key):
+        keys = self._members.get(member)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._members[member]
+
+
+neighborhood_cache = NeighborhoodCache()
+
+
+def cached_customer_neighborhood(customer_id: str, depth: int = 2,
+                                 fanout: int = DEFAULT_FANOUT,
+                                 max_nodes: int = DEFAULT_MAX_NODES,
+                                 driver=None):
+    """get_customer_neighborhood() through the process-wide cache"""
+    key = (customer_id, depth, fanout, max_nodes)
+    result = neighborhood_cache.get(key)
+    if result is None:
+        generation = neighborhood_cache.generation
+        result = get_customer_neighborhood(customer_id, depth, fanout, max_nodes, driver=driver)
+        neighborhood_cache.put(key, result, generation)
+    return result
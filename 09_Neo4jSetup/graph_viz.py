@@ -0,0 +1,122 @@
+## Data service for the agraph visualization in app_3.py.
+## Sampling and aggregation happen in Cypher, so the browser only ever gets
+## at most `max_edges` edges however large the graph is:
+##   top_degree_sample()  - highest-degree customers, each with its most
+##                          bought products (a few per customer)
+##   community_collapse() - customers collapsed by city and products by
+##                          category, one weighted edge per (city, category)
+## Nodes carry only an id, a caption and a size; full properties are fetched
+## with node_properties() when a node is clicked.
+
+from neo4j_utils import get_neo4j_driver
+
+MAX_EDGES = 200        # default edge cap for the browser
+PER_NODE = 5           # products shown per sampled customer
+
+# Labels whose properties can be fetched on click (ids are "<Label>:<id>")
+NODE_LABELS = ("Customer", "Product", "Store")
+GROUPS = {"City": ("Customer", "city"), "Category": ("Product", "category")}
+
+TOP_DEGREE_QUERY = """
+MATCH (c:Customer)
+WITH c, COUNT { (c)-[:BOUGHT]->() } AS deg
+ORDER BY deg DESC
+LIMIT $customers
+CALL {
+    WITH c
+    MATCH (c)-[:BOUGHT]->(p:Product)
+    WITH p, COUNT { (p)<-[:BOUGHT]-() } AS pdeg
+    ORDER BY pdeg DESC
+    LIMIT $per_node
+    RETURN p.id AS product, pdeg
+}
+RETURN c.id AS customer, deg, product, pdeg
+"""
+
+COLLAPSE_QUERY = """
+MATCH (c:Customer)-[:BOUGHT]->(p:Product)
+WITH coalesce(c.city, 'Unknown') AS city, coalesce(p.category, 'Unknown') AS category, count(*) AS weight
+RETURN city, category, weight
+ORDER BY weight DESC
+LIMIT $max_edges
+"""
+
+
+def _size(weight: int, top: int) -> int:
+    # 10..40 px, proportional to the node's weight in the sample
+    return 10 + int(30 * weight / top) if top else 10
+
+
+def top_degree_sample(max_edges: int = MAX_EDGES, per_node: int = PER_NODE, driver=None):
+    """Busiest customers and their most popular products, as {"nodes", "edges"}"""
+    driver = driver or get_neo4j_driver()
+    customers = max(1, max_edges // per_node)
+
+    with driver.session() as session:
+        records = session.execute_read(
+            lambda tx: list(tx.run(TOP_DEGREE_QUERY, customers=customers, per_node=per_node))
+        )
+
+    degrees = {}
+    edges = []
+    for r in records[:max_edges]:
+        c, p = f"Customer:{r['customer']}", f"Product:{r['product']}"
+        degrees[c] = r["deg"]
+        degrees[p] = r["pdeg"]
+        edges.append({"source": c, "target": p, "type": "BOUGHT"})
+
+    top = max(degrees.values(), default=0)
+    nodes = [
+        {"id": key, "caption": key.split(":", 1)[1], "group": key.split(":", 1)[0], "size": _size(deg, top)}
+        for key, deg in degrees.items()
+    ]
+    return {"nodes": nodes, "edges": edges}
+
+
+def community_collapse(max_edges: int = MAX_EDGES, driver=None):
+    """City -> category purchase volumes, as {"nodes", "edges"} with edge weights"""
+    driver = driver or get_neo4j_driver()
+
+    with driver.session() as session:
+        records = session.execute_read(
+            lambda tx: list(tx.run(COLLAPSE_QUERY, max_edges=max_edges))
+        )
+
+    totals = {}
+    edges = []
+    for r in records:
+        city, category = f"City:{r['city']}", f"Category:{r['category']}"
+        totals[city] = totals.get(city, 0) + r["weight"]
+        totals[category] = totals.get(category, 0) + r["weight"]
+        edges.append({"source": city, "target": category, "type": str(r["weight"]), "weight": r["weight"]})
+
+    top = max(totals.values(), default=0)
+    nodes = [
+        {"id": key, "caption": key.split(":", 1)[1], "group": key.split(":", 1)[0], "size": _size(total, top)}
+        for key, total in totals.items()
+    ]
+    return {"nodes": nodes, "edges": edges}
+
+
+def node_properties(node_id: str, driver=None):
+    """
+    Properties of a clicked node: the node itself for "<Label>:<id>", or the
+    member count of a collapsed group for "City:<name>" / "Category:<name>".
+    """
+    driver = driver or get_neo4j_driver()
+    kind, _, key = node_id.partition(":")
+
+    if kind in NODE_LABELS:
+        query = f"MATCH (n:{kind} {{id: $key}}) RETURN properties(n) AS props"
+    elif kind in GROUPS:
+        label, prop = GROUPS[kind]
+        query = (
+            f"MATCH (n:{label}) WHERE coalesce(n.{prop}, 'Unknown') = $key "
+            "RETURN {members: count(n), sample: collect(n.id)[..10]} AS props"
+        )
+    else:
+        return None
+
+    with driver.session() as session:
+        record = session.execute_read(lambda tx: tx.run(query, key=key).single())
+    return record["props"] if record else None
@@ -1,25 +1,71 @@
-
-## This code securely creates a Neo4j database connection using 
-##a password from an environment variable and verifies 
+## This code securely creates a Neo4j database connection using
+##a password from an environment variable and verifies
 ## the connection by running a simple test query.
+## The driver (and its TLS connection pool) is created once per process and
+## shared by the Streamlit apps and the MCP server; callers must not close it.
 
+import atexit
 import os
+import threading
+
 from neo4j import GraphDatabase
 
-def get_neo4j_driver():
-    uri = "neo4j+s://*******.databases.neo4j.io"  # or "bolt://localhost:7687"
-    user = "neo4j"
-    password = os.environ.get("NEO4J_PASSWORD")
-    return GraphDatabase.driver(uri, auth=(user, password))
+NEO4J_URI = os.environ.get("NEO4J_URI", "neo4j+s://*******.databases.neo4j.io")  # or "bolt://localhost:7687"
+NEO4J_USER = os.environ.get("NEO4J_USER", "neo4j")
+
+# Pool settings for the shared driver
+POOL_SIZE = int(os.environ.get("NEO4J_POOL_SIZE", "20"))
+ACQUIRE_TIMEOUT = 30        # seconds to wait for a free pooled connection
+LIVENESS_CHECK_AFTER = 60   # idle seconds after which a connection is pinged before reuse
+MAX_CONNECTION_LIFETIME = 3600
+
+_drivers = {}
+_drivers_lock = threading.Lock()
+
+
+def get_neo4j_driver(uri: str = None, user: str = None, password: str = None):
+    """
+    Return the process-wide driver for (uri, user), creating it on first use.
+    Defaults come from NEO4J_URI / NEO4J_USER / NEO4J_PASSWORD.
+    """
+    uri = uri or NEO4J_URI
+    user = user or NEO4J_USER
+    key = (uri, user)
+
+    with _drivers_lock:
+        driver = _drivers.get(key)
+        if driver is None:
+            driver = GraphDatabase.driver(
+                uri,
+                auth=(user, password or os.environ.get("NEO4J_PASSWORD")),
+                max_connection_pool_size=POOL_SIZE,
+                connection_acquisition_timeout=ACQUIRE_TIMEOUT,
+                liveness_check_timeout=LIVENESS_CHECK_AFTER,
+                max_connection_lifetime=MAX_CONNECTION_LIFETIME,
+                keep_alive=True,
+            )
+            _drivers[key] = driver
+    return driver
+
+
+def close_neo4j_drivers():
+    """Close every shared driver (registered to run at interpreter exit)"""
+    with _drivers_lock:
+        drivers = list(_drivers.values())
+        _drivers.clear()
+    for driver in drivers:
+        driver.close()
+
+
+atexit.register(close_neo4j_drivers)
+
 
 def test_connection():
     driver = get_neo4j_driver()
-    try:
-        with driver.session() as session:
-            result = session.run("RETURN 'Neo4j Connected' AS message")
-            print(result.single()["message"])
-    finally:
-        driver.close()
+    driver.verify_connectivity()
+    with driver.session() as session:
+        result = session.run("RETURN 'Neo4j Connected' AS message")
+        print(result.single()["message"])
 
 if __name__ == "__main__":
-    test_connection()
\ No newline at end of file
+    test_connection()
@@ -1,75 +1,472 @@
 ## This script loads data from Snowflake views and builds a Neo4j graph database.
+## build_graph_from_snowflake() does a full rebuild; sync_graph_from_snowflake()
+## applies only the rows that changed in the base tables since the last load,
+## using Snowflake change tracking (CHANGES clause) and a watermark kept in Neo4j.
+## Rows are written in bounded UNWIND chunks, one transaction per chunk, after
+## ensure_graph_schema() has created the constraints the MERGEs rely on.
+## Full rebuilds stream each view as Arrow batches: a producer thread fetches
+## the next batch while the current chunk is written, so memory stays bounded
+## by a few chunks no matter how large the view is.
+
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-import streamlit as st
 import pandas as pd
+import pyarrow as pa
 from neo4j import GraphDatabase
+from snowflake.connector.errors import ProgrammingError
 from neo4j_utils import get_neo4j_driver
+from snowflake_utils import get_snowflake_pool, query_df
+from graph_neighborhood import neighborhood_cache
+
+SF_SCHEMA = "KG_DEMO_DB.PUBLIC"
+
+# Rows per UNWIND transaction, and parallel writers for node chunks
+CHUNK_SIZE = 10_000
+NODE_WORKERS = 4
+
+# Snowflake errors meaning the CHANGES window can't be served, so only a full
+# rebuild can catch up: the watermark is older than the time travel retention
+# (000707), or change tracking is off / was off during the window
+REBUILD_ERRNOS = {707}
+REBUILD_MESSAGES = ("time travel data is not available", "change tracking is not enabled")
+
+
+# ---------- Cypher ----------
+
+CUSTOMER_UPSERT = """
+    UNWIND $rows AS row
+    MERGE (c:Customer {id: row.ID})
+    SET c.name = row.CUSTOMER_NAME,
+        c.email = row.EMAIL,
+        c.city = row.CITY
+"""
+
+PRODUCT_UPSERT = """
+    UNWIND $rows AS row
+    MERGE (p:Product {id: row.ID})
+    SET p.name = row.PRODUCT_NAME,
+        p.category = row.CATEGORY,
+        p.price = row.PRICE
+"""
+
+STORE_UPSERT = """
+    UNWIND $rows AS row
+    MERGE (s:Store {id: row.ID})
+    SET s.name = row.STORE_NAME,
+        s.city = row.CITY,
+        s.region = row.REGION
+"""
+
+BOUGHT_UPSERT = """
+    UNWIND $rows AS row
+    MATCH (c:Customer {id: row.CUSTOMER_ID})
+    MATCH (p:Product  {id: row.PRODUCT_ID})
+    MERGE (c)-[r:BOUGHT]->(p)
+    SET r.order_date = row.ORDER_DATE,
+        r.quantity = row.QUANTITY,
+        r.total_amount = row.TOTAL_AMOUNT
+"""
+
+VISITED_UPSERT = """
+    UNWIND $rows AS row
+    MATCH (c:Customer {id: row.CUSTOMER_ID})
+    MATCH (s:Store    {id: row.STORE_ID})
+    MERGE (c)-[r:VISITED]->(s)
+    SET r.first_visit_date = row.FIRST_VISIT_DATE
+"""
+
+BOUGHT_DELETE = """
+    UNWIND $rows AS row
+    MATCH (:Customer {id: row.CUSTOMER_ID})-[r:BOUGHT]->(:Product {id: row.PRODUCT_ID})
+    DELETE r
+"""
+
+VISITED_DELETE = """
+    UNWIND $rows AS row
+    MATCH (:Customer {id: row.CUSTOMER_ID})-[r:VISITED]->(:Store {id: row.STORE_ID})
+    DELETE r
+"""
+
+
+def node_delete(label):
+    return f"""
+    UNWIND $rows AS row
+    MATCH (n:{label} {{id: row.ID}})
+    DETACH DELETE n
+"""
+
+
+# ---------- Sync specs ----------
+# Each view is fed by one base table; "keys" maps the view's key columns to the
+# base table columns they come from, and "node_key" is the node property the
+# MERGE matches on. Nodes are listed before relationships so relationship
+# MATCHes always find their endpoints.
+
+NODE_SPECS = [
+    {"label": "Customer", "view": "V_CUSTOMER_NODE", "table": "CUSTOMER",
+     "keys": [("ID", "CUSTOMER_ID")], "node_key": "id", "upsert": CUSTOMER_UPSERT},
+    {"label": "Product", "view": "V_PRODUCT_NODE", "table": "PRODUCT",
+     "keys": [("ID", "PRODUCT_ID")], "node_key": "id", "upsert": PRODUCT_UPSERT},
+    {"label": "Store", "view": "V_STORE_NODE", "table": "STORE",
+     "keys": [("ID", "STORE_ID")], "node_key": "id", "upsert": STORE_UPSERT},
+]
+
+REL_SPECS = [
+    {"type": "BOUGHT", "view": "V_BOUGHT_REL", "table": "ORDERS",
+     "keys": [("CUSTOMER_ID", "CUSTOMER_ID"), ("PRODUCT_ID", "PRODUCT_ID")],
+     "endpoints": [("Customer", "CUSTOMER_ID"), ("Product", "PRODUCT_ID")],
+     "upsert": BOUGHT_UPSERT, "delete": BOUGHT_DELETE},
+    {"type": "VISITED", "view": "V_VISITED_REL", "table": "ORDERS",
+     "keys": [("CUSTOMER_ID", "CUSTOMER_ID"), ("STORE_ID", "STORE_ID")],
+     "endpoints": [("Customer", "CUSTOMER_ID"), ("Store", "STORE_ID")],
+     "upsert": VISITED_UPSERT, "delete": VISITED_DELETE},
+]
+
+
+# Pooled connector from snowflake_utils (no Streamlit caching, always current data)
+def fetch_df(sql: str, params=None):
+    return query_df(sql, params=params)   # returns a Pandas dataframe
+
+
+# ---------- Graph schema ----------
+
+def schema_statements():
+    """One uniqueness constraint (backed by a range index) per loaded label/key"""
+    keys = [(spec["label"], spec["node_key"]) for spec in NODE_SPECS] + [("SyncState", "source")]
+    return [
+        f"CREATE CONSTRAINT {label.lower()}_{key}_unique IF NOT EXISTS "
+        f"FOR (n:{label}) REQUIRE n.{key} IS UNIQUE"
+        for label, key in keys
+    ]
+
+
+def ensure_graph_schema(driver):
+    """
+    Idempotently create the constraints/indexes the MERGE and MATCH statements
+    use, so every lookup is an index seek instead of a label scan.
+    """
+    with driver.session() as session:
+        for statement in schema_statements():
+            session.run(statement).consume()
+        # Constraints created just now may still be populating
+        session.run("CALL db.awaitIndexes(300)").consume()
+
+
+# ---------- Streaming reads ----------
+
+_END = object()
+
+
+def arrow_to_rows(table: pa.Table) -> list:
+    """Arrow batch -> Neo4j parameter rows (NUMBER(p,s) decimals become floats)"""
+    for i, field in enumerate(table.schema):
+        if pa.types.is_decimal(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+    return table.to_pylist()
+
+
+def stream_chunks(sql: str, chunk_size: int = CHUNK_SIZE, prefetch: int = 2):
+    """
+    Yield the rows of a Snowflake query as lists of at most chunk_size dicts.
+
+    A producer thread pulls Arrow batches and re-chunks them into a queue of
+    at most `prefetch` chunks, so fetching overlaps with the caller's writes
+    and memory stays bounded regardless of result size.
+    """
+    chunks = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        # Give up if the consumer went away, instead of blocking forever
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            # The connection stays checked out until the stream is drained or abandoned
+            with get_snowflake_pool().connection() as conn, conn.cursor() as cursor:
+                cursor.execute(sql)
+                buffer = []
+                for batch in cursor.fetch_arrow_batches():
+                    buffer.extend(arrow_to_rows(batch))
+                    while len(buffer) >= chunk_size:
+                        if not put(buffer[:chunk_size]):
+                            return
+                        buffer = buffer[chunk_size:]
+                if buffer and not put(buffer):
+                    return
+            put(_END)
+        except Exception as e:
+            put(e)
+
+    threading.Thread(target=produce, name="snowflake-reader", daemon=True).start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+# ---------- Chunked loading ----------
+
+
+def write_chunk(driver, cypher: str, rows: list) -> float:
+    """Write one chunk in its own (retried) write transaction; returns seconds"""
+    start = time.perf_counter()
+    with driver.session() as session:
+        session.execute_write(lambda tx: tx.run(cypher, rows=rows).consume())
+    return time.perf_counter() - start
+
+
+def load_chunks(driver, jobs, workers: int = 1):
+    """
+    Run (step, cypher, rows) jobs and return per-chunk latency stats.
 
+    With workers > 1 chunks are written concurrently, but at most 2 * workers
+    are pending at a time so client memory stays bounded.
+    """
+    stats = []
+    counters = {}
 
-# Use Streamlit's built-in connection
-def fetch_df(sql: str):
-    conn = st.connection("snowflake")
-    return conn.query(sql)   # returns a Pandas dataframe
+    def numbered():
+        # Chunk numbers follow submission order, not completion order
+        for step, cypher, rows in jobs:
+            counters[step] = counters.get(step, 0) + 1
+            yield {"step": step, "chunk": counters[step], "rows": len(rows)}, cypher, rows
 
-def build_graph_from_snowflake():
-    # 1. Load Snowflake node/relationship views
-    df_c = fetch_df("SELECT * FROM KG_DEMO_DB.PUBLIC.V_CUSTOMER_NODE")
-    df_p = fetch_df("SELECT * FROM KG_DEMO_DB.PUBLIC.V_PRODUCT_NODE")
-    df_s = fetch_df("SELECT * FROM KG_DEMO_DB.PUBLIC.V_STORE_NODE")
-    df_b = fetch_df("SELECT * FROM KG_DEMO_DB.PUBLIC.V_BOUGHT_REL")
-    df_v = fetch_df("SELECT * FROM KG_DEMO_DB.PUBLIC.V_VISITED_REL")
+    if workers <= 1:
+        for info, cypher, rows in numbered():
+            stats.append({**info, "seconds": write_chunk(driver, cypher, rows)})
+        return stats
 
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        for info, cypher, rows in numbered():
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    stats.append({**pending.pop(f), "seconds": f.result()})
+            pending[pool.submit(write_chunk, driver, cypher, rows)] = info
+        for f in list(pending):
+            stats.append({**pending.pop(f), "seconds": f.result()})
+    return stats
+
+
+def node_jobs(chunk_size: int = CHUNK_SIZE):
+    """Streamed chunks of every node view; labels are independent so they can interleave"""
+    for spec in NODE_SPECS:
+        for rows in stream_chunks(f"SELECT * FROM {SF_SCHEMA}.{spec['view']}", chunk_size):
+            yield spec["view"], spec["upsert"], rows
+
+
+def rel_jobs(chunk_size: int = CHUNK_SIZE):
+    """
+    Streamed relationship chunks ordered by (start, end) key, so each transaction
+    locks a contiguous run of customers instead of random nodes across the graph.
+    """
+    for spec in REL_SPECS:
+        order_by = ", ".join(view_col for view_col, _ in spec["keys"])
+        sql = f"SELECT * FROM {SF_SCHEMA}.{spec['view']} ORDER BY {order_by}"
+        for rows in stream_chunks(sql, chunk_size):
+            yield spec["view"], spec["upsert"], rows
+
+
+# ---------- Watermark ----------
+
+def snowflake_now_ms() -> int:
+    """Current Snowflake time as epoch milliseconds (the next watermark)"""
+    df = fetch_df("SELECT DATE_PART(EPOCH_MILLISECOND, CURRENT_TIMESTAMP()) AS TS")
+    return int(df["TS"].iloc[0])
+
+
+def changes_unavailable(error: ProgrammingError) -> bool:
+    """True if a CHANGES query failed because the change window is gone"""
+    message = (error.msg or str(error)).lower()
+    return error.errno in REBUILD_ERRNOS or any(m in message for m in REBUILD_MESSAGES)
+
+
+def read_watermark(session):
+    record = session.run(
+        "MATCH (s:SyncState {source: 'snowflake'}) RETURN s.watermark AS watermark"
+    ).single()
+    return record["watermark"] if record else None
+
+
+def write_watermark(session, watermark: int):
+    session.run(
+        "MERGE (s:SyncState {source: 'snowflake'}) SET s.watermark = $wm, s.synced_at = datetime()",
+        wm=watermark,
+    )
+
+
+# ---------- Full rebuild ----------
+
+def build_graph_from_snowflake(chunk_size: int = CHUNK_SIZE, node_workers: int = NODE_WORKERS,
+                               with_schema: bool = True):
+    """
+    Drop the graph and reload every node/relationship view.
+    Node chunks load in parallel; relationship chunks load one at a time after
+    all nodes exist. Returns load stats with per-chunk latency; the watermark
+    is set so later syncs can be incremental. with_schema=False skips the
+    constraint step (only useful for benchmarking).
+    """
+    start = time.perf_counter()
+    watermark = snowflake_now_ms()
+
+    driver = get_neo4j_driver()
+    if with_schema:
+        ensure_graph_schema(driver)
+
+    with driver.session() as session:
+        # Optional reset for PoC, batched so a large graph isn't one huge transaction
+        session.run("MATCH (n) CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS")
+
+    # Snowflake views are streamed straight into the writers
+    chunks = load_chunks(driver, node_jobs(chunk_size), workers=node_workers)
+    chunks += load_chunks(driver, rel_jobs(chunk_size))
+
+    upserted = {spec["view"]: 0 for spec in NODE_SPECS + REL_SPECS}
+    for chunk in chunks:
+        upserted[chunk["step"]] += chunk["rows"]
+
+    with driver.session() as session:
+        write_watermark(session, watermark)
+
+    # Every cached neighborhood may have changed
+    neighborhood_cache.invalidate()
+    return {
+        "mode": "full",
+        "upserted": upserted,
+        "deleted": {},
+        "touched": None,  # everything
+        "chunks": chunks,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+# ---------- Incremental sync ----------
+
+def _changes_sql(spec) -> str:
+    """
+    Keys changed in the base table between two watermarks, left-joined to the
+    current view rows. A key with no view row left means it was deleted.
+    """
+    changed_cols = ", ".join(f"{table_col} AS {view_col}" for view_col, table_col in spec["keys"])
+    join = " AND ".join(f"v.{view_col} = changed.{view_col}" for view_col, _ in spec["keys"])
+    key_cols = ", ".join(f"changed.{view_col} AS CHANGED_{view_col}" for view_col, _ in spec["keys"])
+    return f"""
+    WITH changed AS (
+        SELECT DISTINCT {changed_cols}
+        FROM {SF_SCHEMA}.{spec['table']}
+            CHANGES(INFORMATION => DEFAULT)
+            AT(TIMESTAMP => TO_TIMESTAMP_LTZ(%(since)s, 3))
+            END(TIMESTAMP => TO_TIMESTAMP_LTZ(%(until)s, 3))
+    )
+    SELECT {key_cols}, v.*
+    FROM changed
+    LEFT JOIN {SF_SCHEMA}.{spec['view']} v ON {join}
+    """
+
+
+def _split_changes(spec, df: pd.DataFrame):
+    """Split a changes frame into rows to upsert and keys to delete"""
+    first_key = spec["keys"][0][0]
+    present = df[first_key].notna()
+
+    view_cols = [c for c in df.columns if not c.startswith("CHANGED_")]
+    upserts = df.loc[present, view_cols].to_dict("records")
+
+    deletes = [
+        {view_col: row[f"CHANGED_{view_col}"] for view_col, _ in spec["keys"]}
+        for row in df.loc[~present].to_dict("records")
+    ]
+    return upserts, deletes
+
+
+def sync_graph_from_snowflake():
+    """
+    Apply inserts, updates and deletes since the last load to the Neo4j graph.
+
+    Falls back to a full rebuild when there is no watermark yet (first load),
+    the watermark is older than the tables' change-tracking retention, or change
+    tracking is off; any other Snowflake error is raised.
+    Returns load stats, including the node ids touched per label.
+    """
+    start = time.perf_counter()
     driver = get_neo4j_driver()
+    ensure_graph_schema(driver)
 
     with driver.session() as session:
-        # Optional reset for PoC
-        session.run("MATCH (n) DETACH DELETE n")
-
-        # Customer nodes
-        session.run("""
-            UNWIND $rows AS row
-            MERGE (c:Customer {id: row.ID})
-            SET c.name = row.CUSTOMER_NAME,
-                c.email = row.EMAIL,
-                c.city = row.CITY
-        """, rows=df_c.to_dict("records"))
-
-        # Product nodes
-        session.run("""
-            UNWIND $rows AS row
-            MERGE (p:Product {id: row.ID})
-            SET p.name = row.PRODUCT_NAME,
-                p.category = row.CATEGORY,
-                p.price = row.PRICE
-        """, rows=df_p.to_dict("records"))
-
-        # Store nodes
-        session.run("""
-            UNWIND $rows AS row
-            MERGE (s:Store {id: row.ID})
-            SET s.name = row.STORE_NAME,
-                s.city = row.CITY,
-                s.region = row.REGION
-        """, rows=df_s.to_dict("records"))
-
-        # BOUGHT relationships
-        session.run("""
-            UNWIND $rows AS row
-            MATCH (c:Customer {id: row.CUSTOMER_ID})
-            MATCH (p:Product  {id: row.PRODUCT_ID})
-            MERGE (c)-[r:BOUGHT]->(p)
-            SET r.order_date = row.ORDER_DATE,
-                r.quantity = row.QUANTITY,
-                r.total_amount = row.TOTAL_AMOUNT
-        """, rows=df_b.to_dict("records"))
-
-        # VISITED relationships
-        session.run("""
-            UNWIND $rows AS row
-            MATCH (c:Customer {id: row.CUSTOMER_ID})
-            MATCH (s:Store    {id: row.STORE_ID})
-            MERGE (c)-[r:VISITED]->(s)
-            SET r.first_visit_date = row.FIRST_VISIT_DATE
-        """, rows=df_v.to_dict("records"))
-
-    driver.close()
+        since = read_watermark(session)
+    if since is None:
+        return build_graph_from_snowflake()
+
+    until = snowflake_now_ms()
+    params = {"since": since, "until": until}
+
+    try:
+        changes = {
+            spec["view"]: _split_changes(spec, fetch_df(_changes_sql(spec), params=params))
+            for spec in NODE_SPECS + REL_SPECS
+        }
+    except ProgrammingError as e:
+        # Anything else (network, suspended warehouse, bad SQL) must not wipe the graph
+        if not changes_unavailable(e):
+            raise
+        return build_graph_from_snowflake()
+
+    touched = {spec["label"]: set() for spec in NODE_SPECS}
+    upserted = {view: len(rows) for view, (rows, _) in changes.items()}
+    deleted = {view: len(keys) for view, (_, keys) in changes.items()}
+
+    def jobs():
+        # Upserts: nodes first, then relationships (they MATCH their endpoints)
+        for spec in NODE_SPECS + REL_SPECS:
+            rows, _ = changes[spec["view"]]
+            for start_row in range(0, len(rows), CHUNK_SIZE):
+                yield spec["view"], spec["upsert"], rows[start_row:start_row + CHUNK_SIZE]
+        # Deletes: relationships first, then nodes
+        for spec in REL_SPECS + NODE_SPECS:
+            _, keys = changes[spec["view"]]
+            cypher = spec.get("delete") or node_delete(spec["label"])
+            for start_row in range(0, len(keys), CHUNK_SIZE):
+                yield spec["view"], cypher, keys[start_row:start_row + CHUNK_SIZE]
+
+    # Ordered, single writer: deletes must follow upserts
+    chunks = load_chunks(driver, jobs())
+
+    with driver.session() as session:
+        for spec in NODE_SPECS:
+            rows, keys = changes[spec["view"]]
+            touched[spec["label"]].update(r["ID"] for r in rows + keys)
+        for spec in REL_SPECS:
+            rows, keys = changes[spec["view"]]
+            for label, col in spec["endpoints"]:
+                touched[label].update(r[col] for r in rows + keys)
+
+        # Only advance the watermark once every change has been written
+        write_watermark(session, until)
+
+    # Drop cached neighborhoods that contain any node this sync touched
+    neighborhood_cache.invalidate(touched)
+    return {
+        "mode": "incremental",
+        "upserted": upserted,
+        "deleted": deleted,
+        "touched": touched,
+        "chunks": chunks,
+        "seconds": time.perf_counter() - start,
+    }
@@ -0,0 +1,149 @@
+## Lightweight Snowflake access shared by the MCP server, ai_tools_mcp.py and
+## the graph loader. Uses snowflake-connector-python directly with a small
+## connection pool, so headless code doesn't import Streamlit or go through
+## st.connection's caching. Settings come from SNOWFLAKE_* environment
+## variables, or from the same [connections.snowflake] block of
+## .streamlit/secrets.toml the Streamlit apps use.
+## snowflake.connector is imported on first use, not at import time: it is the
+## single largest import of the MCP server (~0.35s), and the server should be
+## able to list its tools before any Snowflake call is made.
+
+import atexit
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+CONNECTION_KEYS = ("account", "user", "password", "role", "warehouse", "database", "schema")
+
+POOL_SIZE = int(os.environ.get("SNOWFLAKE_POOL_SIZE", "4"))
+ACQUIRE_TIMEOUT = 60   # seconds to wait for a free pooled connection
+
+
+def _secrets_paths():
+    if os.environ.get("SNOWFLAKE_SECRETS"):
+        yield Path(os.environ["SNOWFLAKE_SECRETS"])
+    yield Path.cwd() / ".streamlit" / "secrets.toml"
+    yield Path(__file__).resolve().parent / ".streamlit" / "secrets.toml"
+    yield Path.home() / ".streamlit" / "secrets.toml"
+
+
+def load_connection_config() -> dict:
+    """
+    Connection parameters: SNOWFLAKE_ACCOUNT, SNOWFLAKE_USER, ... if set,
+    otherwise the first secrets.toml found with a [connections.snowflake] block.
+    """
+    env = {k: os.environ[f"SNOWFLAKE_{k.upper()}"] for k in CONNECTION_KEYS
+           if os.environ.get(f"SNOWFLAKE_{k.upper()}")}
+    if "account" in env:
+        return env
+
+    for path in _secrets_paths():
+        if path.is_file():
+            with open(path, "rb") as f:
+                secrets = tomllib.load(f)
+            conn = secrets.get("connections", {}).get("snowflake")
+            if conn:
+                return {**{k: conn[k] for k in CONNECTION_KEYS if k in conn}, **env}
+
+    raise RuntimeError("No Snowflake settings: set SNOWFLAKE_* env vars or .streamlit/secrets.toml")
+
+
+class SnowflakePool:
+    """Up to `size` connections, opened lazily and reused across threads"""
+
+    def __init__(self, config: dict, size: int = POOL_SIZE):
+        self.config = config
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        import snowflake.connector
+        from snowflake.connector.errors import InterfaceError, OperationalError
+
+        if not self._slots.acquire(timeout=ACQUIRE_TIMEOUT):
+            raise TimeoutError("Timed out waiting for a pooled Snowflake connection")
+        conn = None
+        try:
+            try:
+                conn = self._idle.get_nowait()
+                if conn.is_closed():
+                    conn = None
+            except queue.Empty:
+                pass
+            if conn is None:
+                conn = snowflake.connector.connect(**self.config)
+            yield conn
+        except (InterfaceError, OperationalError):
+            # Don't hand a broken connection to the next caller; SQL errors keep it
+            if conn is not None:
+                conn.close()
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.put(conn)
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_snowflake_pool() -> SnowflakePool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SnowflakePool(load_connection_config())
+    return _pool
+
+
+def close_snowflake_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+atexit.register(close_snowflake_pool)
+
+
+def query_rows(sql: str, params=None) -> list:
+    """Run a query (pyformat %(name)s params) and return rows as dicts"""
+    from snowflake.connector import DictCursor
+
+    with get_snowflake_pool().connection() as conn:
+        with conn.cursor(DictCursor) as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+
+def query_df(sql: str, params=None):
+    """Same as query_rows(), as a pandas DataFrame (pandas is imported on demand)"""
+    with get_snowflake_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetch_pandas_all()
+
+
+def execute(sql: str, params=None):
+    """Run a statement and return the number of affected rows"""
+    with get_snowflake_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.rowcount
@@ -0,0 +1,144 @@
+## Tests for the CortexRetriever cache in cortex_retrieval.py, against a fake
+## search backend (no Snowflake needed):
+##   python -m pytest -q test_cortex_retrieval.py
+
+import pytest
+
+import cortex_retrieval
+from cortex_retrieval import CortexRetriever, normalize_question
+
+
+class FakeBackend:
+    """Serves up to `available` chunks per question and records every call"""
+
+    def __init__(self, available=50):
+        self.available = available
+        self.calls = []
+
+    def __call__(self, service, question, limit):
+        self.calls.append((service, question, limit))
+        return [
+            {"DOC_ID": f"d{i}", "TITLE": question, "CONTENT": f"chunk {i}",
+             "@scores": {"cosine_similarity": 1 - i / 100, "text_match": 0.5}}
+            for i in range(min(limit, self.available))
+        ]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cortex_retrieval.time, "monotonic", lambda: now[0])
+    return now
+
+
+def doc_ids(results):
+    return [r["doc_id"] for r in results]
+
+
+def test_normalize_question():
+    assert normalize_question("  What is   CORTEX search?? ") == "what is cortex search"
+    assert normalize_question("What is Cortex Search.") == normalize_question("what is cortex search")
+    assert normalize_question("a\tb\nc!") == "a b c"
+
+
+def test_miss_prefetches_and_smaller_limit_is_sliced(clock):
+    backend = FakeBackend()
+    retriever = CortexRetriever(backend, service="SVC", prefetch=10)
+
+    assert doc_ids(retriever.search("What is Cortex?", limit=5)) == [f"d{i}" for i in range(5)]
+    assert backend.calls == [("SVC", "What is Cortex?", 10)]
+
+    # Up to the prefetched 10 is served from the cache, for any spelling of the question
+    assert doc_ids(retriever.search("what is cortex", limit=3)) == ["d0", "d1", "d2"]
+    assert len(retriever.search("WHAT IS CORTEX?", limit=10)) == 10
+    assert len(backend.calls) == 1
+    assert retriever.info()["hits"] == 2 and retriever.info()["misses"] == 1
+
+
+def test_larger_limit_requeries(clock):
+    backend = FakeBackend()
+    retriever = CortexRetriever(backend, prefetch=10)
+
+    retriever.search("q", limit=5)
+    assert len(retriever.search("q", limit=20)) == 20
+    assert [limit for *_, limit in backend.calls] == [10, 20]
+
+    # The bigger result replaces the cached one
+    retriever.search("q", limit=15)
+    assert len(backend.calls) == 2
+
+
+def test_short_result_is_complete(clock):
+    backend = FakeBackend(available=4)
+    retriever = CortexRetriever(backend, prefetch=10)
+
+    assert len(retriever.search("rare topic", limit=5)) == 4
+    # Fewer than the 10 fetched came back, so there is nothing more to ask for
+    assert len(retriever.search("rare topic", limit=30)) == 4
+    assert len(backend.calls) == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    backend = FakeBackend()
+    retriever = CortexRetriever(backend, ttl=60)
+
+    retriever.search("q")
+    clock[0] += 60
+    retriever.search("q")
+    assert len(backend.calls) == 1
+
+    clock[0] += 0.5
+    retriever.search("q")
+    assert len(backend.calls) == 2
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    backend = FakeBackend()
+    retriever = CortexRetriever(backend, maxsize=2)
+
+    retriever.search("a")
+    retriever.search("b")
+    retriever.search("a")        # a is now the most recently used
+    retriever.search("c")        # evicts b
+
+    assert retriever.info()["size"] == 2
+    retriever.search("a")
+    assert len(backend.calls) == 3
+    retriever.search("b")
+    assert [question for _, question, _ in backend.calls] == ["a", "b", "c", "b"]
+
+
+def test_results_are_flattened_with_scores(clock):
+    backend = FakeBackend()
+    (result,) = CortexRetriever(backend).search("q", limit=1)
+
+    assert result == {
+        "doc_id": "d0", "title": "q", "section": "N/A", "content": "chunk 0",
+        "score": 1.0, "text_match": 0.5,
+    }
+
+
+def test_clear_drops_cached_results(clock):
+    backend = FakeBackend()
+    retriever = CortexRetriever(backend)
+
+    retriever.search("q")
+    retriever.clear()
+    retriever.search("q")
+    assert len(backend.calls) == 2
+
+
+def test_fields_are_resolved_per_row(clock):
+    def backend(service, question, limit):
+        # Rows of one response with different columns, one nested under "record"
+        return [
+            {"DOC_ID": "d0", "TITLE": "Guide", "CONTENT": "first"},
+            {"record": {"id": "d1", "source": "faq.md", "text": "second", "page": 3}},
+        ]
+
+    results = CortexRetriever(backend).search("q", limit=2)
+
+    assert [(r["doc_id"], r["title"], r["section"], r["content"]) for r in results] == [
+        ("d0", "Guide", "N/A", "first"),
+        ("d1", "faq.md", 3, "second"),
+    ]
@@ -0,0 +1,431 @@
+## Tests for the chunked UNWIND load and the incremental sync in sf_to_neo4j.py,
+## against an in-process fake Neo4j driver and a fake Snowflake pool (no servers needed):
+##   python -m pytest -q test_sf_to_neo4j.py
+
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+from snowflake.connector.errors import ProgrammingError
+
+import sf_to_neo4j
+
+ROWS = {
+    "V_CUSTOMER_NODE": [{"ID": f"C{i:03}", "CUSTOMER_NAME": f"c{i}", "EMAIL": "", "CITY": "X"} for i in range(23)],
+    "V_PRODUCT_NODE": [{"ID": f"P{i:03}", "PRODUCT_NAME": f"p{i}", "CATEGORY": "Y", "PRICE": 1.5} for i in range(9)],
+    "V_STORE_NODE": [{"ID": "S1", "STORE_NAME": "s", "CITY": "X", "REGION": "Z"}],
+    "V_BOUGHT_REL": [{"CUSTOMER_ID": f"C{i:03}", "PRODUCT_ID": f"P{i % 9:03}"} for i in range(17)],
+    "V_VISITED_REL": [],
+}
+
+
+# ---------- Fake Neo4j driver ----------
+
+class FakeResult:
+    def __init__(self, tx=None, record=None):
+        self.tx = tx
+        self.record = record
+
+    def consume(self):
+        if self.tx is not None:
+            # Consumed inside the unit of work, before the transaction commits
+            assert not self.tx.closed
+            self.tx.consumed += 1
+        return None
+
+    def single(self):
+        return self.record
+
+
+class FakeTx:
+    def __init__(self, driver):
+        self.driver = driver
+        self.runs = []
+        self.consumed = 0
+        self.closed = False
+
+    def run(self, cypher, **params):
+        if self.driver.fail_on and self.driver.fail_on in cypher:
+            raise RuntimeError("write failed")
+        self.runs.append((cypher, params))
+        return FakeResult(self)
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, cypher, **params):
+        # Auto-commit statements (schema, reset, watermark)
+        with self.driver.lock:
+            self.driver.statements.append(cypher)
+            self.driver.auto_commit.append(cypher)
+        if "RETURN s.watermark" in cypher:
+            return FakeResult(record={"watermark": self.driver.watermark} if self.driver.watermark else None)
+        if "MERGE (s:SyncState" in cypher:
+            self.driver.watermark = params["wm"]
+        return FakeResult()
+
+    def execute_write(self, fn):
+        # A single attempt: commits what fn ran, and keeps fn so tests can replay
+        # it the way the real driver does on a retry
+        tx = FakeTx(self.driver)
+        result = fn(tx)
+        tx.closed = True
+        with self.driver.lock:
+            self.driver.units.append((fn, tx))
+            self.driver.writes.extend(tx.runs)
+            self.driver.statements.extend(cypher for cypher, _ in tx.runs)
+        return result
+
+
+class FakeDriver:
+    def __init__(self, watermark=None, fail_on=None):
+        self.watermark = watermark  # :SyncState watermark
+        self.fail_on = fail_on      # a transaction running cypher containing this fails
+        self.lock = threading.Lock()
+        self.statements = []   # every statement, in commit order
+        self.auto_commit = []  # statements run outside execute_write
+        self.writes = []       # committed (cypher, params) from execute_write
+        self.units = []        # (unit of work, its committed tx) per execute_write
+
+    def session(self):
+        return FakeSession(self)
+
+
+# ---------- Fake Snowflake pool ----------
+
+class FakeCursor:
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        view = next(v for v in ROWS if f".{v}" in sql)
+        self.rows = ROWS[view]
+
+    def fetch_arrow_batches(self):
+        for start in range(0, len(self.rows), self.batch_size):
+            yield pa.Table.from_pylist(self.rows[start:start + self.batch_size])
+
+
+class FakeConnection:
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+
+    def cursor(self):
+        return FakeCursor(self.batch_size)
+
+
+class FakePool:
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+
+    @contextmanager
+    def connection(self):
+        yield FakeConnection(self.batch_size)
+
+
+@pytest.fixture
+def fake_env(monkeypatch):
+    driver = FakeDriver()
+    monkeypatch.setattr(sf_to_neo4j, "get_neo4j_driver", lambda: driver)
+    # Arrow batches of 7 rows, so chunks of 5 have to be cut across batch boundaries
+    monkeypatch.setattr(sf_to_neo4j, "get_snowflake_pool", lambda: FakePool(batch_size=7))
+    monkeypatch.setattr(sf_to_neo4j, "snowflake_now_ms", lambda: 1_700_000_000_000)
+    return driver
+
+
+def chunk_sizes(total, size):
+    return [min(size, total - start) for start in range(0, total, size)]
+
+
+def test_full_load_chunk_boundaries(fake_env):
+    stats = sf_to_neo4j.build_graph_from_snowflake(chunk_size=5, node_workers=2)
+
+    by_view = {}
+    for chunk in stats["chunks"]:
+        by_view.setdefault(chunk["step"], []).append(chunk)
+    for view, rows in ROWS.items():
+        chunks = sorted(by_view.get(view, []), key=lambda c: c["chunk"])
+        assert [c["rows"] for c in chunks] == chunk_sizes(len(rows), 5), view
+        assert [c["chunk"] for c in chunks] == list(range(1, len(chunks) + 1))
+        assert stats["upserted"][view] == len(rows)
+
+    # Every row is written exactly once, and no transaction exceeds the chunk size
+    written = {}
+    for cypher, params in fake_env.writes:
+        assert cypher.lstrip().startswith("UNWIND $rows")
+        assert 0 < len(params["rows"]) <= 5
+        written.setdefault(cypher, []).extend(params["rows"])
+    for spec in sf_to_neo4j.NODE_SPECS + sf_to_neo4j.REL_SPECS:
+        assert sorted(map(str, written.get(spec["upsert"], []))) == sorted(map(str, ROWS[spec["view"]]))
+
+
+def test_relationships_written_after_all_nodes(fake_env):
+    sf_to_neo4j.build_graph_from_snowflake(chunk_size=5, node_workers=4)
+
+    node_cyphers = {spec["upsert"] for spec in sf_to_neo4j.NODE_SPECS}
+    rel_cyphers = {spec["upsert"] for spec in sf_to_neo4j.REL_SPECS}
+    kinds = [
+        "node" if cypher in node_cyphers else "rel"
+        for cypher, _ in fake_env.writes
+        if cypher in node_cyphers | rel_cyphers
+    ]
+    assert "rel" in kinds
+    assert kinds.index("rel") == kinds.count("node")
+
+
+def test_constraints_created_before_any_write(fake_env):
+    sf_to_neo4j.build_graph_from_snowflake(chunk_size=5)
+
+    statements = fake_env.statements
+    constraints = sf_to_neo4j.schema_statements()
+    assert all(s.startswith("CREATE CONSTRAINT") and "IF NOT EXISTS" in s for s in constraints)
+    assert statements[:len(constraints)] == constraints
+    assert statements[len(constraints)] == "CALL db.awaitIndexes(300)"
+    for spec in sf_to_neo4j.NODE_SPECS:
+        assert any(f"FOR (n:{spec['label']}) REQUIRE n.{spec['node_key']} IS UNIQUE" in s for s in constraints)
+
+    first_write = statements.index(fake_env.writes[0][0])
+    assert first_write > len(constraints)
+
+
+def test_schema_skipped_when_disabled(fake_env):
+    sf_to_neo4j.build_graph_from_snowflake(chunk_size=5, with_schema=False)
+    assert not any(s.startswith("CREATE CONSTRAINT") for s in fake_env.statements)
+
+
+def test_each_chunk_is_one_replayable_unit_of_work():
+    driver = FakeDriver()
+    rows = [{"ID": i} for i in range(12)]
+    jobs = [("V", "UNWIND $rows AS row MERGE (n:N {id: row.ID})", rows[i:i + 5]) for i in range(0, 12, 5)]
+
+    stats = sf_to_neo4j.load_chunks(driver, jobs)
+
+    assert [c["rows"] for c in stats] == [5, 5, 2]
+    assert len(driver.units) == len(jobs)
+    for (fn, tx), (_, cypher, chunk) in zip(driver.units, jobs):
+        # One statement per transaction, its result consumed inside the function
+        assert tx.runs == [(cypher, {"rows": chunk})]
+        assert tx.consumed == 1
+        # The driver retries by calling the function again: it must run the same write
+        replay = FakeTx(driver)
+        fn(replay)
+        assert replay.runs == tx.runs
+
+
+def test_writes_only_go_through_execute_write(fake_env):
+    sf_to_neo4j.build_graph_from_snowflake(chunk_size=5)
+
+    assert not any(s.lstrip().startswith("UNWIND") for s in fake_env.auto_commit)
+    assert len(fake_env.units) == sum(len(chunk_sizes(len(rows), 5)) for rows in ROWS.values())
+
+
+def test_parallel_load_writes_each_chunk_once():
+    driver = FakeDriver()
+    jobs = [("V", "UNWIND $rows AS row MERGE (n:N {id: row.ID})", [{"ID": i}]) for i in range(20)]
+
+    stats = sf_to_neo4j.load_chunks(driver, iter(jobs), workers=4)
+
+    assert sorted(params["rows"][0]["ID"] for _, params in driver.writes) == list(range(20))
+    assert sorted(c["chunk"] for c in stats) == list(range(1, 21))
+
+
+# ---------- Incremental sync ----------
+
+WATERMARK = 1_600_000_000_000
+
+VIEW_COLUMNS = {view: list(rows[0]) for view, rows in ROWS.items() if rows}
+VIEW_COLUMNS["V_VISITED_REL"] = ["CUSTOMER_ID", "STORE_ID", "FIRST_VISIT_DATE"]
+
+
+def update(**row):
+    # Snowflake reports an UPDATE as a DELETE + INSERT pair with ISUPDATE set
+    return [
+        dict(row, **{"METADATA$ACTION": "DELETE", "METADATA$ISUPDATE": True}),
+        dict(row, **{"METADATA$ACTION": "INSERT", "METADATA$ISUPDATE": True}),
+    ]
+
+
+def changes_frame(spec, change_rows, view_rows):
+    """What _changes_sql selects: the DISTINCT changed keys LEFT JOINed to the view"""
+    keys = []
+    for row in change_rows:
+        key = tuple(row[table_col] for _, table_col in spec["keys"])
+        if key not in keys:
+            keys.append(key)
+    records = []
+    for key in keys:
+        changed = {f"CHANGED_{view_col}": k for (view_col, _), k in zip(spec["keys"], key)}
+        matches = [r for r in view_rows if tuple(r[view_col] for view_col, _ in spec["keys"]) == key]
+        for match in matches or [dict.fromkeys(VIEW_COLUMNS[spec["view"]])]:
+            records.append({**changed, **match})
+    columns = [f"CHANGED_{view_col}" for view_col, _ in spec["keys"]] + VIEW_COLUMNS[spec["view"]]
+    return pd.DataFrame(records, columns=columns)
+
+
+@pytest.fixture
+def changes(monkeypatch, fake_env):
+    """Base table CHANGES rows by table, served through a fake fetch_df"""
+    tables = {"CUSTOMER": [], "PRODUCT": [], "STORE": [], "ORDERS": []}
+    fake_env.watermark = WATERMARK
+    fake_env.queries = []
+
+    def fetch_df(sql, params=None):
+        spec = next(s for s in sf_to_neo4j.NODE_SPECS + sf_to_neo4j.REL_SPECS if f".{s['view']} v" in sql)
+        fake_env.queries.append((spec["view"], params))
+        return changes_frame(spec, tables[spec["table"]], ROWS[spec["view"]])
+
+    monkeypatch.setattr(sf_to_neo4j, "fetch_df", fetch_df)
+    return tables
+
+
+def written(driver, cypher):
+    return [row for c, params in driver.writes if c == cypher for row in params["rows"]]
+
+
+def test_changes_sql_reads_distinct_keys_between_watermarks():
+    spec = sf_to_neo4j.REL_SPECS[0]
+    sql = " ".join(sf_to_neo4j._changes_sql(spec).split())
+
+    assert "SELECT DISTINCT CUSTOMER_ID AS CUSTOMER_ID, PRODUCT_ID AS PRODUCT_ID FROM KG_DEMO_DB.PUBLIC.ORDERS" in sql
+    assert "CHANGES(INFORMATION => DEFAULT) AT(TIMESTAMP => TO_TIMESTAMP_LTZ(%(since)s, 3)) " \
+           "END(TIMESTAMP => TO_TIMESTAMP_LTZ(%(until)s, 3))" in sql
+    assert "LEFT JOIN KG_DEMO_DB.PUBLIC.V_BOUGHT_REL v " \
+           "ON v.CUSTOMER_ID = changed.CUSTOMER_ID AND v.PRODUCT_ID = changed.PRODUCT_ID" in sql
+
+
+def test_split_changes_upserts_present_keys_and_deletes_missing_ones():
+    spec = sf_to_neo4j.NODE_SPECS[0]
+    change_rows = (
+        update(CUSTOMER_ID="C001")
+        + [{"CUSTOMER_ID": "C005", "METADATA$ACTION": "INSERT", "METADATA$ISUPDATE": False}]
+        + [{"CUSTOMER_ID": "C999", "METADATA$ACTION": "DELETE", "METADATA$ISUPDATE": False}]
+    )
+
+    upserts, deletes = sf_to_neo4j._split_changes(spec, changes_frame(spec, change_rows, ROWS["V_CUSTOMER_NODE"]))
+
+    # The DELETE half of the update pair must not delete the node
+    assert upserts == [ROWS["V_CUSTOMER_NODE"][1], ROWS["V_CUSTOMER_NODE"][5]]
+    assert deletes == [{"ID": "C999"}]
+
+
+def test_split_changes_uses_every_relationship_key():
+    spec = sf_to_neo4j.REL_SPECS[0]
+    change_rows = [
+        {"CUSTOMER_ID": "C002", "PRODUCT_ID": "P002", "STORE_ID": "S1", "METADATA$ACTION": "INSERT"},
+        {"CUSTOMER_ID": "C002", "PRODUCT_ID": "P007", "STORE_ID": "S1", "METADATA$ACTION": "DELETE"},
+    ]
+
+    upserts, deletes = sf_to_neo4j._split_changes(spec, changes_frame(spec, change_rows, ROWS["V_BOUGHT_REL"]))
+
+    assert upserts == [{"CUSTOMER_ID": "C002", "PRODUCT_ID": "P002"}]
+    assert deletes == [{"CUSTOMER_ID": "C002", "PRODUCT_ID": "P007"}]
+
+
+def test_sync_applies_changes_and_advances_the_watermark(fake_env, changes):
+    changes["CUSTOMER"] += update(CUSTOMER_ID="C001") + [
+        {"CUSTOMER_ID": "C999", "METADATA$ACTION": "DELETE", "METADATA$ISUPDATE": False},
+    ]
+    changes["ORDERS"] += [
+        {"CUSTOMER_ID": "C999", "PRODUCT_ID": "P001", "STORE_ID": "S9", "METADATA$ACTION": "DELETE"},
+    ]
+
+    stats = sf_to_neo4j.sync_graph_from_snowflake()
+
+    assert stats["mode"] == "incremental"
+    assert all(params == {"since": WATERMARK, "until": 1_700_000_000_000} for _, params in fake_env.queries)
+    assert written(fake_env, sf_to_neo4j.CUSTOMER_UPSERT) == [ROWS["V_CUSTOMER_NODE"][1]]
+    assert written(fake_env, sf_to_neo4j.BOUGHT_DELETE) == [{"CUSTOMER_ID": "C999", "PRODUCT_ID": "P001"}]
+    assert written(fake_env, sf_to_neo4j.VISITED_DELETE) == [{"CUSTOMER_ID": "C999", "STORE_ID": "S9"}]
+    assert written(fake_env, sf_to_neo4j.node_delete("Customer")) == [{"ID": "C999"}]
+    assert stats["touched"]["Customer"] == {"C001", "C999"}
+    assert stats["touched"]["Store"] == {"S9"}
+    assert fake_env.watermark == 1_700_000_000_000
+    assert not any(s.startswith("MATCH (n) CALL") for s in fake_env.statements)
+
+
+def test_sync_deletes_relationships_before_nodes(fake_env, changes):
+    changes["CUSTOMER"].append({"CUSTOMER_ID": "C999", "METADATA$ACTION": "DELETE"})
+    changes["PRODUCT"].append({"PRODUCT_ID": "P999", "METADATA$ACTION": "DELETE"})
+    changes["ORDERS"].append({"CUSTOMER_ID": "C999", "PRODUCT_ID": "P999", "STORE_ID": "S1", "METADATA$ACTION": "DELETE"})
+    changes["ORDERS"].append({"CUSTOMER_ID": "C003", "PRODUCT_ID": "P003", "STORE_ID": "S1", "METADATA$ACTION": "INSERT"})
+
+    sf_to_neo4j.sync_graph_from_snowflake()
+
+    node_deletes = {sf_to_neo4j.node_delete(spec["label"]) for spec in sf_to_neo4j.NODE_SPECS}
+    rel_deletes = {spec["delete"] for spec in sf_to_neo4j.REL_SPECS}
+    upserts = {spec["upsert"] for spec in sf_to_neo4j.NODE_SPECS + sf_to_neo4j.REL_SPECS}
+    order = [c for c, _ in fake_env.writes]
+    kinds = ["upsert" if c in upserts else "rel_delete" if c in rel_deletes else "node_delete" for c in order]
+    assert set(order) <= upserts | rel_deletes | node_deletes
+    assert kinds == sorted(kinds, key=["upsert", "rel_delete", "node_delete"].index)
+    assert kinds.count("rel_delete") == 2 and kinds.count("node_delete") == 2
+
+
+@pytest.mark.parametrize("fail_on", ["MERGE (c:Customer", "DETACH DELETE n"])
+def test_failed_chunk_keeps_the_watermark(fake_env, changes, fail_on):
+    changes["CUSTOMER"] += update(CUSTOMER_ID="C001") + [{"CUSTOMER_ID": "C999", "METADATA$ACTION": "DELETE"}]
+    fake_env.fail_on = fail_on
+
+    with pytest.raises(RuntimeError):
+        sf_to_neo4j.sync_graph_from_snowflake()
+
+    # The next sync re-reads the same window
+    assert fake_env.watermark == WATERMARK
+    assert not any("SyncState" in s and "MERGE" in s for s in fake_env.statements)
+
+
+def test_sync_without_watermark_does_a_full_rebuild(fake_env):
+    stats = sf_to_neo4j.sync_graph_from_snowflake()
+
+    assert stats["mode"] == "full"
+    assert fake_env.watermark == 1_700_000_000_000
+
+
+@pytest.mark.parametrize("error", [
+    ProgrammingError(msg="Time travel data is not available for table ORDERS.", errno=707),
+    ProgrammingError(msg="Change tracking is not enabled or has been missing for the time range requested on table 'CUSTOMER'.", errno=1234),
+])
+def test_unavailable_changes_fall_back_to_a_full_rebuild(fake_env, changes, monkeypatch, error):
+    def fetch_df(sql, params=None):
+        raise error
+
+    monkeypatch.setattr(sf_to_neo4j, "fetch_df", fetch_df)
+
+    stats = sf_to_neo4j.sync_graph_from_snowflake()
+
+    assert sf_to_neo4j.changes_unavailable(error)
+    assert stats["mode"] == "full"
+    assert any(s.startswith("MATCH (n) CALL") for s in fake_env.statements)
+    assert fake_env.watermark == 1_700_000_000_000
+
+
+def test_other_snowflake_errors_do_not_rebuild(fake_env, changes, monkeypatch):
+    error = ProgrammingError(msg="Object 'KG_DEMO_DB.PUBLIC.ORDERS' does not exist or not authorized.", errno=2003)
+    def fetch_df(sql, params=None):
+        raise error
+
+    monkeypatch.setattr(sf_to_neo4j, "fetch_df", fetch_df)
+
+    with pytest.raises(ProgrammingError):
+        sf_to_neo4j.sync_graph_from_snowflake()
+
+    assert not sf_to_neo4j.changes_unavailable(error)
+    assert not any(s.startswith("MATCH (n) CALL") for s in fake_env.statements)
+    assert fake_env.watermark == WATERMARK
@@ -2,20 +2,28 @@ import streamlit as st
 from snowflake.snowpark.context import get_active_session
 from snowflake.snowpark.functions import col
 import pandas as pd
-from datetime import datetime
 import uuid
-import json
-from io import BytesIO
-import base64
 import os
 import tempfile
 
+from invoice_jobs import InvoiceJobQueue, DONE, FAILED
+from invoice_line_items import LineItemStore, safe_decimal
+
 # Configuration
 st.set_page_config(layout="wide", page_title="Invoice Processing System")
 
 # Initialize session
 session = get_active_session()
 
+# Max number of AI_EXTRACT calls running at the same time
+MAX_CONCURRENT_EXTRACTIONS = 2
+
+# Header widget keys that must be reset when switching invoices
+INVOICE_WIDGET_KEYS = (
+    "vendor_name", "invoice_no", "po_no", "invoice_date",
+    "subtotal", "tax_amount", "total", "deposit_credit",
+)
+
 # Styling
 st.markdown("""
     <style>
@@ -102,131 +110,52 @@ if "extracted_data" not in st.session_state:
     st.session_state.extracted_data = None
 if "header_df" not in st.session_state:
     st.session_state.header_df = None
-if "detail_df" not in st.session_state:
-    st.session_state.detail_df = None
+if "line_items" not in st.session_state:
+    st.session_state.line_items = None
 if "pdf_content" not in st.session_state:
     st.session_state.pdf_content = None
 if "file_path" not in st.session_state:
     st.session_state.file_path = None
 if "header_editable" not in st.session_state:
     st.session_state.header_editable = {}
-if "detail_editable" not in st.session_state:
-    st.session_state.detail_editable = {}
 if "ai_extract_completed" not in st.session_state:
     st.session_state.ai_extract_completed = False
 if "current_file_id" not in st.session_state:
     st.session_state.current_file_id = None
 if "header_changes" not in st.session_state:
     st.session_state.header_changes = {}
-if "detail_changes" not in st.session_state:
-    st.session_state.detail_changes = {}
+if "invoice_jobs" not in st.session_state:
+    st.session_state.invoice_jobs = {}  # file_id -> job_id
 
 # ====================== HELPER FUNCTIONS ======================
 
-def upload_file_to_stage(uploaded_file):
-    """Upload file to Snowflake internal stage"""
-    try:
-        unique_id = str(uuid.uuid4())[:8]
-        file_ext = uploaded_file.name.split('.')[-1]
-        file_name_only = uploaded_file.name.rsplit('.', 1)[0]
-        current_date = datetime.now().strftime("%m-%d-%Y")
-        
-        filename = f"{file_name_only}_{unique_id}.{file_ext}"
-        stage_path = f"invoices/{current_date}/{filename}"
-        full_stage_path = f"@<DB_NAME>.<SCHEMA>.INVOICE_UPLOADS/{stage_path}"
-        
-        # Read file bytes
-        file_bytes = BytesIO(uploaded_file.getvalue())
-        
-        # Put file to stage
-        result = session.file.put_stream(
-            file_bytes,
-            stage_location=f"@<DB_NAME>.<SCHEMA>.INVOICE_UPLOADS/{stage_path}",
-            auto_compress=False
-        )
-        
-        # Verify file was uploaded
-        st.success(f"File uploaded to stage: {full_stage_path}")
-        
-        return full_stage_path
-    except Exception as e:
-        st.error(f"Error uploading file to stage: {str(e)}")
-        return None
+@st.cache_resource
+def get_job_queue():
+    """Process-wide background queue for staging + AI_EXTRACT"""
+    return InvoiceJobQueue(session, max_workers=MAX_CONCURRENT_EXTRACTIONS)
 
-def extract_invoice_data(file_path):
-    """Extract invoice data using Snowflake AI_EXTRACT"""
-    try:
-        query = f"""
-        SELECT AI_EXTRACT(
-            file => TO_FILE('@<DB_NAME>.<SCHEMA>.INVOICE_UPLOADS', '{file_path}'),
-            responseFormat => {{
-                'schema': {{
-                    'type': 'object',
-                    'properties': {{
-                        'VendorName': {{
-                            'type': 'string',
-                            'description': 'The name of the company sending the invoice'
-                        }},
-                        'InvoiceNo': {{
-                            'type': 'string',
-                            'description': 'The unique invoice identifier number'
-                        }},
-                        'PurchaseOrderNo': {{
-                            'type': 'string',
-                            'description': 'The unique optional purchase order number'
-                        }},
-                        'InvoiceDate': {{
-                            'type': 'string',
-                            'description': 'The date the invoice was issued (e.g., YYYY-MM-DD)'
-                        }},
-                        'InvoiceSubtotal': {{
-                            'type': 'string',
-                            'description': 'The total amount before taxes and fees'
-                        }},
-                        'InvoiceTaxAmount': {{
-                            'type': 'string',
-                            'description': 'The total amount of tax charged on the invoice'
-                        }},
-                        'InvoiceTotal': {{
-                            'type': 'string',
-                            'description': 'The final total amount due, including taxes and fees'
-                        }},
-                        'DepositCreditAmount': {{
-                            'type': 'string',
-                            'description': 'The deposit or credit amount applied to the invoice (optional)'
-                        }},
-                        'Quantities': {{
-                            'type': 'array',
-                            'description': 'An array of all quantities for each line item',
-                            'items': {{'type': 'string'}}
-                        }},
-                        'ItemDescriptions': {{
-                            'type': 'array',
-                            'description': 'An array of all descriptions for each line item',
-                            'items': {{'type': 'string'}}
-                        }},
-                        'LineTotals': {{
-                            'type': 'array',
-                            'description': 'An array of all total prices for each line item',
-                            'items': {{'type': 'string'}}
-                        }}
-                    }}
-                }}
-            }}
-        ) as extracted_data;
-        """
-        
-        result = session.sql(query).collect()
-        if result:
-            extracted_json = result[0][0]
-            return json.loads(extracted_json)
-        return None
-    except Exception as e:
-        st.error(f"Error extracting data: {str(e)}")
-        return None
+def load_job_result(job, file_id):
+    """Move a finished extraction job into the editor state"""
+    header_df, line_items = split_extracted_data(job.result)
+    if header_df is None or line_items is None:
+        return False
+    # Drop widget state left over from the previously reviewed invoice
+    for key in INVOICE_WIDGET_KEYS:
+        st.session_state.pop(key, None)
+    reset_line_item_widgets()
+    st.session_state.file_path = job.file_path
+    st.session_state.pdf_content = job.file_bytes
+    st.session_state.extracted_data = job.result
+    st.session_state.header_df = header_df
+    st.session_state.line_items = line_items
+    st.session_state.header_editable = header_df.to_dict(orient="records")[0]
+    st.session_state.header_changes = {}
+    st.session_state.ai_extract_completed = True
+    st.session_state.current_file_id = file_id
+    return True
 
-def split_data_into_dataframes(extracted_data):
-    """Split extracted data into header and detail dataframes"""
+def split_extracted_data(extracted_data):
+    """Split extracted data into a header dataframe and a line item store"""
     try:
         response = extracted_data.get("response", {})
         
@@ -244,31 +173,20 @@ def split_data_into_dataframes(extracted_data):
         
         header_df = pd.DataFrame([header_data])
         
-        # Detail data
-        quantities = response.get("Quantities", [])
-        descriptions = response.get("ItemDescriptions", [])
-        line_totals = response.get("LineTotals", [])
-        
-        # Ensure all arrays are same length
-        max_len = max(len(quantities), len(descriptions), len(line_totals))
-        quantities.extend([""] * (max_len - len(quantities)))
-        descriptions.extend([""] * (max_len - len(descriptions)))
-        line_totals.extend([""] * (max_len - len(line_totals)))
-        
-        detail_data = {
-            "LineNumber": list(range(1, max_len + 1)),
-            "Description": descriptions,
-            "Quantity": quantities,
-            "LineTotal": line_totals,
-        }
+        # Detail data (shorter arrays are padded with blank lines)
+        line_items = LineItemStore.from_extracted(response)
         
-        detail_df = pd.DataFrame(detail_data)
-        
-        return header_df, detail_df
+        return header_df, line_items
     except Exception as e:
         st.error(f"Error splitting data: {str(e)}")
         return None, None
 
+def reset_line_item_widgets():
+    """Forget line item widget state so rows re-read their values from the store"""
+    for key in list(st.session_state.keys()):
+        if key.startswith(("line_num_", "desc_", "qty_", "linetotal_")):
+            del st.session_state[key]
+
 def display_pdf_from_stage(pdf_stage_path):
     """Display PDF from Snowflake stage using st.pdf"""
     try:
@@ -337,38 +255,22 @@ def display_pdf(file_bytes, file_type):
     except Exception as e:
         st.error(f"Error displaying file: {str(e)}")
 
-def safe_decimal(value):
-    """Safely convert value to decimal string, handling currency formatting"""
-    try:
-        if value is None:
-            return "0"
-        if isinstance(value, str) and value.strip().lower() == "none":
-            return "0"
-        # Remove currency symbols, commas, and whitespace
-        cleaned = str(value).replace("$", "").replace(",", "").strip()
-        return str(float(cleaned)) if cleaned else "0"
-    except Exception:
-        return "0"
-
 def update_header_field(field_name, value):
     """Update a header field and track the change locally"""
     st.session_state.header_editable[field_name] = value
     st.session_state.header_changes[field_name] = value
 
 def update_detail_field(detail_index, field_name, value):
-    """Update a detail line item field and track the change locally"""
-    if detail_index < len(st.session_state.detail_editable):
-        st.session_state.detail_editable[detail_index][field_name] = value
-        if detail_index not in st.session_state.detail_changes:
-            st.session_state.detail_changes[detail_index] = {}
-        st.session_state.detail_changes[detail_index][field_name] = value
+    """Update a detail line item field; the store logs the change"""
+    if detail_index < len(st.session_state.line_items):
+        st.session_state.line_items.set(detail_index, field_name, value)
 
 def get_cached_validation():
     """Get validation result - recompute each time for accuracy"""
     # Always compute fresh to ensure comparison_field is correct
     validation_result = validate_invoice_totals(
         st.session_state.header_editable,
-        st.session_state.detail_editable
+        st.session_state.line_items
     )
     return validation_result
 
@@ -376,12 +278,12 @@ def get_change_summary():
     """Get a summary of all local changes made by the user"""
     return {
         "header_changes": st.session_state.header_changes,
-        "detail_changes": st.session_state.detail_changes,
+        "detail_changes": st.session_state.line_items.changes,
         "total_header_changes": len(st.session_state.header_changes),
-        "total_detail_changes": len(st.session_state.detail_changes)
+        "total_detail_changes": len(st.session_state.line_items.changed_lines())
     }
 
-def save_to_tables(header_df, detail_df, file_path):
+def save_to_tables(header_df, line_items, file_path):
     """Save header and detail data to Snowflake Hybrid Tables in a single transaction."""
     try:
         invoice_id = str(uuid.uuid4())
@@ -413,17 +315,17 @@ def save_to_tables(header_df, detail_df, file_path):
         
         # Build a single multi-row VALUES insert for details
         detail_values_sql_parts = []
-        for _, detail_row in detail_df.iterrows():
-            description = (detail_row.get("Description") or "").strip()
-            quantity = safe_decimal(detail_row.get("Quantity"))
-            line_total = safe_decimal(detail_row.get("LineTotal"))
+        for item in line_items:
+            description = (item.description or "").strip()
+            quantity = safe_decimal(item.quantity)
+            line_total = safe_decimal(item.line_total)
             
             # Skip completely empty lines
             if not description and float(quantity) == 0 and float(line_total) == 0:
                 continue
             
             detail_id = str(uuid.uuid4())
-            line_number = int(detail_row.get("LineNumber") or 0)
+            line_number = item.line_number
             detail_values_sql_parts.append(
                 f"('{detail_id}', '{invoice_id}', {line_number}, "
                 f"'{description.replace(chr(39), chr(39)+chr(39))}', {quantity}, {line_total})"
@@ -455,23 +357,12 @@ def save_to_tables(header_df, detail_df, file_path):
         st.error(f"Error saving to database: {str(e)}")
         return False, None
 
-def validate_invoice_totals(header_editable, detail_editable):
+def validate_invoice_totals(header_editable, line_items):
     """Validate that sum of line items matches subtotal (if valid and > 0) or invoice total"""
     try:
-        # Calculate sum of line totals
-        line_total_sum = 0
-        for detail in detail_editable:
-            line_total = detail.get("LineTotal", "0")
-            if line_total and str(line_total).strip():
-                try:
-                    # Use safe_decimal to handle currency formatting
-                    parsed_value = float(safe_decimal(line_total))
-                    line_total_sum += parsed_value
-                except (ValueError, TypeError):
-                    pass
-        
-        # Round to 2 decimal places to fix floating-point precision
-        line_total_sum = round(line_total_sum, 2)
+        # Sum of line totals (already parsed and rounded by the store)
+        line_total_sum = line_items.line_total_sum()
+        invalid_cells = line_items.invalid_cells()
         
         # Get subtotal - check if it's valid and greater than 0
         subtotal_raw = header_editable.get("InvoiceSubtotal", "")
@@ -510,6 +401,7 @@ def validate_invoice_totals(header_editable, detail_editable):
             "invoice_total": float(safe_decimal(header_editable.get("InvoiceTotal", "0"))),
             "difference": difference,
             "matches": difference == 0,  # Exact match required - difference must be 0
+            "invalid_cells": invalid_cells,
             "tolerance": tolerance,
             "debug_subtotal_raw": str(subtotal_raw),
             "debug_subtotal_parsed": subtotal
@@ -526,36 +418,72 @@ save_clicked = False
 
 # ===== ALWAYS VISIBLE: UPLOAD SIDEBAR =====
 st.sidebar.subheader("📤 Upload Invoice")
-uploaded_file_sidebar = st.sidebar.file_uploader(
+uploaded_files_sidebar = st.sidebar.file_uploader(
     "Choose Invoice",
     type=["pdf", "jpg", "jpeg", "png"],
-    key="invoice_uploader_sidebar"
+    key="invoice_uploader_sidebar",
+    accept_multiple_files=True
 )
 
-# Process sidebar uploaded file immediately
-if uploaded_file_sidebar:
-    file_id = uploaded_file_sidebar.name + str(uploaded_file_sidebar.size)
-    if file_id != st.session_state.current_file_id or not st.session_state.ai_extract_completed:
-        with st.spinner("⏳ Processing invoice..."):
-            file_path = upload_file_to_stage(uploaded_file_sidebar)
-            if file_path:
-                st.session_state.file_path = file_path
-                st.session_state.pdf_content = uploaded_file_sidebar.getvalue()
-                extracted_data = extract_invoice_data(file_path.replace("@<DB_NAME>.<SCHEMA>.INVOICE_UPLOADS/", ""))
-                if extracted_data:
-                    st.session_state.extracted_data = extracted_data
-                    header_df, detail_df = split_data_into_dataframes(extracted_data)
-                    if header_df is not None and detail_df is not None:
-                        st.session_state.header_df = header_df
-                        st.session_state.detail_df = detail_df
-                        st.session_state.header_editable = header_df.to_dict(orient="records")[0]
-                        st.session_state.detail_editable = detail_df.to_dict(orient="records")
-                        st.session_state.ai_extract_completed = True
-                        st.session_state.current_file_id = file_id
-                        st.rerun()
+job_queue = get_job_queue()
+
+# Hand new uploads to the background queue; staging + AI_EXTRACT run off the script thread
+for uploaded in uploaded_files_sidebar or []:
+    file_id = uploaded.name + str(uploaded.size)
+    if file_id not in st.session_state.invoice_jobs:
+        st.session_state.invoice_jobs[file_id] = job_queue.submit(uploaded.name, uploaded.getvalue())
+
+jobs_running = any(
+    (job := job_queue.get(job_id)) is not None and not job.finished
+    for job_id in st.session_state.invoice_jobs.values()
+)
+
+@st.fragment(run_every=2 if jobs_running else None)
+def show_job_status():
+    """Poll background jobs and load finished invoices into the editor"""
+    for file_id, job_id in list(st.session_state.invoice_jobs.items()):
+        job = job_queue.get(job_id)
+        if job is None:
+            continue
+        info = job.snapshot()
+
+        if info["status"] == DONE:
+            is_current = file_id == st.session_state.current_file_id
+            st.caption(f"✅ {info['file_name']} ({info['elapsed']:.1f}s)")
+            # Open the first finished invoice automatically, the rest on demand
+            if not st.session_state.ai_extract_completed or (
+                not is_current and st.button("Review", key=f"review_{job_id}")
+            ):
+                if load_job_result(job, file_id):
+                    # The editor now holds the result and file bytes; free the queue's copy
+                    job_queue.forget(job_id)
+                    st.rerun()
+        elif info["status"] == FAILED:
+            st.error(f"❌ {info['file_name']}: {info['error']}")
+            if st.button("Retry", key=f"retry_{job_id}"):
+                job_queue.forget(job_id)
+                st.session_state.invoice_jobs[file_id] = job_queue.submit(job.file_name, job.file_bytes)
+                st.rerun()
+        else:
+            st.progress(
+                info["progress"],
+                text=f"⏳ {info['file_name']}: {info['status']} (attempt {info['attempts']})"
+            )
+
+    # Refresh the whole page once the last running job settles
+    if jobs_running and all(
+        (job := job_queue.get(job_id)) is None or job.finished
+        for job_id in st.session_state.invoice_jobs.values()
+    ):
+        st.rerun()
+
+if st.session_state.invoice_jobs:
+    with st.sidebar:
+        st.subheader("🧾 Extraction Jobs")
+        show_job_status()
 
 # Display layout if data exists
-if st.session_state.header_df is not None and st.session_state.detail_df is not None:
+if st.session_state.header_df is not None and st.session_state.line_items is not None:
     st.divider()
     
     # Main layout: 20% left (header) + 80% right (PDF + details)
@@ -675,6 +603,13 @@ if st.session_state.header_df is not None and st.session_state.detail_df is not
                 st.write(f"**Difference:** {validation_result.get('difference', 0)}")
                 st.write(f"**Matches:** {validation_result.get('matches', False)}")
         
+        if validation_result and validation_result.get("invalid_cells"):
+            rows = sorted({idx + 1 for idx, _ in validation_result["invalid_cells"]})
+            st.error(
+                f"❌ Line item amounts that are not numbers (lines {', '.join(map(str, rows))}) "
+                "count as 0 in the totals and are saved as 0. Please correct them."
+            )
+        
         if validation_result and not validation_result.get("matches", False):
             try:
                 comparison_field = validation_result.get('comparison_field', 'InvoiceTotal')
@@ -725,69 +660,69 @@ if st.session_state.header_df is not None and st.session_state.detail_df is not
         # Add/Remove line items controls
         col_add, col_remove = st.columns([1, 1])
         
+        line_items = st.session_state.line_items
+        
         with col_add:
             if st.button("➕ Add Line Item", key="add_line_item"):
                 # Add a new blank line item
-                new_line = {
-                    "LineNumber": len(st.session_state.detail_editable) + 1,
-                    "Description": "",
-                    "Quantity": "0",
-                    "LineTotal": ""
-                }
-                st.session_state.detail_editable.append(new_line)
+                line_items.append()
                 st.rerun()
         
         with col_remove:
-            if len(st.session_state.detail_editable) > 1:
+            if len(line_items) > 1:
                 if st.button("➖ Remove Last Item", key="remove_line_item"):
                     # Remove last line item
-                    st.session_state.detail_editable.pop()
+                    line_items.pop()
                     st.rerun()
         
         st.divider()
         
-        # Editable detail table
-        detail_data_list = []
-        
-        for idx in range(len(st.session_state.detail_editable)):
+        # Editable detail table; the store only records cells whose value changed
+        for idx in range(len(line_items)):
+            item = line_items[idx]
             col1, col2, col3, col4, col5 = st.columns([0.8, 2.5, 0.8, 0.8, 0.5])
             
             with col1:
-                st.session_state.detail_editable[idx]["LineNumber"] = st.number_input(
+                st.number_input(
                     "Line #",
-                    value=st.session_state.detail_editable[idx].get("LineNumber", idx + 1),
+                    value=item.line_number,
                     key=f"line_num_{idx}",
                     disabled=True
                 )
             
             with col2:
-                st.session_state.detail_editable[idx]["Description"] = st.text_input(
+                line_items.set(idx, "Description", st.text_input(
                     "Description",
-                    value=st.session_state.detail_editable[idx].get("Description", ""),
+                    value=item.description,
                     key=f"desc_{idx}"
-                )
+                ))
             
             with col3:
-                st.session_state.detail_editable[idx]["Quantity"] = st.text_input(
+                line_items.set(idx, "Quantity", st.text_input(
                     "Qty",
-                    value=str(st.session_state.detail_editable[idx].get("Quantity", "")),
+                    value=item.quantity,
                     key=f"qty_{idx}"
-                )
+                ))
+                if not line_items.is_valid(idx, "Quantity"):
+                    st.caption(":red[Not a number]")
             
             with col4:
-                st.text_input(
+                line_items.set(idx, "LineTotal", st.text_input(
                     "Total",
-                    value=str(st.session_state.detail_editable[idx].get("LineTotal", "")),
-                    key=f"linetotal_{idx}",
-                    on_change=lambda idx=idx: st.session_state.detail_editable[idx].update({"LineTotal": st.session_state.get(f"linetotal_{idx}", "")}) if idx < len(st.session_state.detail_editable) else None
-                )
+                    value=item.line_total,
+                    key=f"linetotal_{idx}"
+                ))
+                if not line_items.is_valid(idx, "LineTotal"):
+                    st.caption(":red[Not a number]")
             
             with col5:
                 # Remove button for each line (only show if more than 1 line item)
-                if len(st.session_state.detail_editable) > 1:
+                if len(line_items) > 1:
                     st.write("\u200b")  # Invisible Unicode space for alignment
                     if st.button("❌", key=f"remove_{idx}", help="Delete this line item"):
-                        st.session_state.detail_editable.pop(idx)
+                        line_items.pop(idx)
+                        # Rows below shift up, so their widgets must re-read the store
+                        reset_line_item_widgets()
                         st.rerun()
                 else:
                     st.write("")
@@ -795,18 +730,17 @@ if st.session_state.header_df is not None and st.session_state.detail_df is not
 # ===== SAVE FUNCTIONALITY =====
 if save_clicked and st.session_state.header_df is not None:
     with st.spinner("💾 Saving data to database..."):
-        # Update DataFrames with edited values
+        # Update header DataFrame with edited values
         header_df = pd.DataFrame([st.session_state.header_editable])
-        detail_df = pd.DataFrame(st.session_state.detail_editable)
         
         # Save to tables
-        success, invoice_id = save_to_tables(header_df, detail_df, st.session_state.file_path)
+        success, invoice_id = save_to_tables(header_df, st.session_state.line_items, st.session_state.file_path)
         
         if success:
             st.success(f"✅ Invoice saved successfully! Invoice ID: {invoice_id}")
             st.balloons()
             # Clear change tracking after successful save
             st.session_state.header_changes = {}
-            st.session_state.detail_changes = {}
+            st.session_state.line_items.clear_changes()
         else:
             st.error("❌ Failed to save invoice data")
@@ -0,0 +1,250 @@
+# Background job queue for the invoice app.
+# Uploads are submitted as jobs; a bounded thread pool stages each file and runs
+# AI_EXTRACT on it, retrying transient failures with exponential backoff.
+# The Streamlit script only submits jobs and polls their status, so the UI never
+# blocks on an AI_EXTRACT call. Nothing in here touches Streamlit, so the queue
+# can be exercised with any object that looks like a Snowpark session.
+
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+try:
+    from snowflake.connector.errors import InterfaceError, OperationalError
+    TRANSIENT_ERRORS = (TimeoutError, ConnectionError, OperationalError, InterfaceError)
+except ImportError:
+    TRANSIENT_ERRORS = (TimeoutError, ConnectionError)
+
+STAGE_NAME = "@<DB_NAME>.<SCHEMA>.INVOICE_UPLOADS"
+
+# AI_EXTRACT response schema. Add fields here; the SQL text never changes.
+INVOICE_RESPONSE_FORMAT = {
+    "schema": {
+        "type": "object",
+        "properties": {
+            "VendorName": {
+                "type": "string",
+                "description": "The name of the company sending the invoice"
+            },
+            "InvoiceNo": {
+                "type": "string",
+                "description": "The unique invoice identifier number"
+            },
+            "PurchaseOrderNo": {
+                "type": "string",
+                "description": "The unique optional purchase order number"
+            },
+            "InvoiceDate": {
+                "type": "string",
+                "description": "The date the invoice was issued (e.g., YYYY-MM-DD)"
+            },
+            "InvoiceSubtotal": {
+                "type": "string",
+                "description": "The total amount before taxes and fees"
+            },
+            "InvoiceTaxAmount": {
+                "type": "string",
+                "description": "The total amount of tax charged on the invoice"
+            },
+            "InvoiceTotal": {
+                "type": "string",
+                "description": "The final total amount due, including taxes and fees"
+            },
+            "DepositCreditAmount": {
+                "type": "string",
+                "description": "The deposit or credit amount applied to the invoice (optional)"
+            },
+            "Quantities": {
+                "type": "array",
+                "description": "An array of all quantities for each line item",
+                "items": {"type": "string"}
+            },
+            "ItemDescriptions": {
+                "type": "array",
+                "description": "An array of all descriptions for each line item",
+                "items": {"type": "string"}
+            },
+            "LineTotals": {
+                "type": "array",
+                "description": "An array of all total prices for each line item",
+                "items": {"type": "string"}
+            }
+        }
+    }
+}
+
+# Serialized once at import and bound on every call
+RESPONSE_FORMAT_JSON = json.dumps(INVOICE_RESPONSE_FORMAT)
+
+# Constant statement text: file path and schema are bind parameters, so every
+# extraction sends the same SQL (eligible for server-side plan/result reuse)
+EXTRACT_SQL = f"""
+SELECT AI_EXTRACT(
+    file => TO_FILE('{STAGE_NAME}', ?),
+    responseFormat => PARSE_JSON(?)
+) AS extracted_data
+"""
+
+# Job states
+PENDING = "pending"
+STAGING = "staging"
+EXTRACTING = "extracting"
+RETRYING = "retrying"
+DONE = "done"
+FAILED = "failed"
+
+
+# ---------- Snowflake calls (session is passed in) ----------
+
+def upload_file_to_stage(session, file_name, file_bytes):
+    """Upload file bytes to the invoice stage and return the full stage path"""
+    unique_id = str(uuid.uuid4())[:8]
+    file_ext = file_name.split('.')[-1]
+    file_name_only = file_name.rsplit('.', 1)[0]
+    current_date = datetime.now().strftime("%m-%d-%Y")
+
+    stage_path = f"invoices/{current_date}/{file_name_only}_{unique_id}.{file_ext}"
+    full_stage_path = f"{STAGE_NAME}/{stage_path}"
+
+    session.file.put_stream(
+        BytesIO(file_bytes),
+        stage_location=full_stage_path,
+        auto_compress=False
+    )
+    return full_stage_path
+
+
+def extract_invoice_data(session, file_path):
+    """Extract invoice data using Snowflake AI_EXTRACT"""
+    result = session.sql(EXTRACT_SQL, params=[file_path, RESPONSE_FORMAT_JSON]).collect()
+    if result:
+        return json.loads(result[0][0])
+    return None
+
+
+# ---------- Jobs ----------
+
+class InvoiceJob:
+    """One uploaded invoice moving through staging and extraction"""
+
+    def __init__(self, file_name, file_bytes):
+        self.id = str(uuid.uuid4())
+        self.file_name = file_name
+        self.file_bytes = file_bytes
+        self.status = PENDING
+        self.progress = 0.0
+        self.attempts = 0
+        self.error = None
+        self.file_path = None
+        self.result = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def snapshot(self):
+        """Consistent copy of the job state for the UI"""
+        with self._lock:
+            return {
+                "id": self.id,
+                "file_name": self.file_name,
+                "status": self.status,
+                "progress": self.progress,
+                "attempts": self.attempts,
+                "error": self.error,
+                "file_path": self.file_path,
+                "elapsed": (self.finished_at or time.time()) - self.submitted_at,
+            }
+
+
+class InvoiceJobQueue:
+    """
+    Runs staging + AI_EXTRACT for submitted invoices on a bounded thread pool.
+
+    max_workers caps how many AI_EXTRACT calls run at once; transient errors
+    (connection drops, timeouts) are retried up to max_retries times with
+    exponential backoff starting at backoff_seconds.
+    """
+
+    def __init__(self, session, max_workers=2, max_retries=3, backoff_seconds=1.0,
+                 stage_fn=upload_file_to_stage, extract_fn=extract_invoice_data):
+        self.session = session
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._stage_fn = stage_fn
+        self._extract_fn = extract_fn
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="invoice-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, file_name, file_bytes):
+        job = InvoiceJob(file_name, file_bytes)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job.id
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.submitted_at)
+
+    def forget(self, job_id):
+        """Drop a finished job (and its file bytes) from the queue"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.finished:
+                del self._jobs[job_id]
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job):
+        try:
+            job.update(status=STAGING, progress=0.1)
+            file_path = self._with_retries(
+                job, STAGING, self._stage_fn, self.session, job.file_name, job.file_bytes
+            )
+            job.update(file_path=file_path, status=EXTRACTING, progress=0.4)
+
+            relative_path = file_path.replace(f"{STAGE_NAME}/", "")
+            result = self._with_retries(job, EXTRACTING, self._extract_fn, self.session, relative_path)
+            if not result:
+                raise ValueError("AI_EXTRACT returned no data")
+            job.update(result=result, status=DONE, progress=1.0, error=None)
+        except Exception as e:
+            job.update(status=FAILED, error=str(e))
+        finally:
+            job.update(finished_at=time.time())
+
+    def _with_retries(self, job, step, fn, *args):
+        attempt = 0
+        while True:
+            attempt += 1
+            job.update(attempts=job.attempts + 1)
+            try:
+                return fn(*args)
+            except TRANSIENT_ERRORS as e:
+                if attempt > self.max_retries:
+                    raise
+                delay = self.backoff_seconds * (2 ** (attempt - 1))
+                delay += random.uniform(0, self.backoff_seconds)
+                job.update(status=RETRYING, error=f"{step} attempt {attempt} failed: {e}")
+                time.sleep(delay)
+                job.update(status=step, error=None)
@@ -0,0 +1,229 @@
+# Compact, column-oriented store for extracted invoice line items.
+# Quantities and line totals live in typed arrays and descriptions in a single
+# list, instead of one dict per line, so long invoices (and several of them kept
+# for batch review) stay small in st.session_state. The editor still shows what
+# AI_EXTRACT returned or the reviewer typed ("2", "12.50", "$1,000.50"): each
+# amount keeps its number of decimals, and only text that formatting cannot
+# reproduce (currency signs, thousands separators, values that are not a number)
+# is kept as a string. Every edit is appended to a diff log, which replaces the
+# old per-line change dicts.
+
+import math
+from array import array
+
+FIELDS = ("Description", "Quantity", "LineTotal")
+
+RAW = -1            # places value: the cell's text is kept in LineItemStore.raw
+MAX_PLACES = 15
+
+
+def safe_decimal(value):
+    """Safely convert value to decimal string, handling currency formatting"""
+    try:
+        if value is None:
+            return "0"
+        if isinstance(value, str) and value.strip().lower() == "none":
+            return "0"
+        # Remove currency symbols, commas, and whitespace
+        cleaned = str(value).replace("$", "").replace(",", "").strip()
+        return str(float(cleaned)) if cleaned else "0"
+    except Exception:
+        return "0"
+
+
+def parse_amount(value):
+    """Numeric value of an extracted/edited amount: 0.0 when blank, None when not a number"""
+    if value is None:
+        return 0.0
+    cleaned = str(value).replace("$", "").replace(",", "").strip()
+    if not cleaned or cleaned.lower() == "none":
+        return 0.0
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def _raw(value):
+    return "" if value is None else str(value)
+
+
+def _encode(text):
+    """(value, places) for an amount cell: NaN when not a number, places RAW when
+    f"{value:.{places}f}" would not give the text back"""
+    value = parse_amount(text)
+    if value is None:
+        return math.nan, RAW
+    places = len(text.partition(".")[2])
+    if places <= MAX_PLACES and f"{value:.{places}f}" == text:
+        return value, places
+    return value, RAW
+
+
+class LineItem:
+    """Read-only view of one row; line numbers follow the row position"""
+
+    __slots__ = ("line_number", "description", "quantity", "line_total")
+
+    def __init__(self, line_number, description, quantity, line_total):
+        self.line_number = line_number
+        self.description = description
+        self.quantity = quantity
+        self.line_total = line_total
+
+
+class LineItemStore:
+    """
+    Line items held as parallel columns: descriptions in a list, quantities and
+    line totals as float arrays (NaN where the cell is not a number) with the
+    decimals each one was written with. raw holds the text of the few amount
+    cells that formatting cannot reproduce, keyed by (row id, field).
+
+    Rows have ids that stay the same when rows above them are removed, and
+    changes is the diff log: one (action, row_id, field, old, new) tuple per
+    edit, where action is "set", "add" or "remove".
+    """
+
+    __slots__ = (
+        "ids", "descriptions", "quantities", "quantity_places",
+        "line_totals", "line_total_places", "raw", "changes", "_next_id",
+    )
+
+    def __init__(self):
+        self.ids = array("q")
+        self.descriptions = []
+        self.quantities = array("d")
+        self.quantity_places = array("b")
+        self.line_totals = array("d")
+        self.line_total_places = array("b")
+        self.raw = {}
+        self.changes = []
+        self._next_id = 0
+
+    @classmethod
+    def from_extracted(cls, response):
+        """Build the store from the Quantities/ItemDescriptions/LineTotals arrays of AI_EXTRACT"""
+        quantities = response.get("Quantities") or []
+        descriptions = response.get("ItemDescriptions") or []
+        line_totals = response.get("LineTotals") or []
+
+        store = cls()
+        # Missing entries in the shorter arrays become blank lines
+        for i in range(max(len(quantities), len(descriptions), len(line_totals))):
+            store._append_row(
+                _raw(descriptions[i]) if i < len(descriptions) else "",
+                _raw(quantities[i]) if i < len(quantities) else "",
+                _raw(line_totals[i]) if i < len(line_totals) else "",
+            )
+        return store
+
+    def __len__(self):
+        return len(self.descriptions)
+
+    def __getitem__(self, index):
+        return LineItem(
+            index + 1,
+            self.descriptions[index],
+            self.get(index, "Quantity"),
+            self.get(index, "LineTotal"),
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _columns(self, field):
+        if field == "Quantity":
+            return self.quantities, self.quantity_places
+        if field == "LineTotal":
+            return self.line_totals, self.line_total_places
+        raise KeyError(field)
+
+    def _write(self, index, field, text):
+        values, places = self._columns(field)
+        values[index], places[index] = _encode(text)
+        key = (self.ids[index], field)
+        if places[index] == RAW:
+            self.raw[key] = text
+        else:
+            self.raw.pop(key, None)
+
+    def _append_row(self, description, quantity, line_total):
+        self.ids.append(self._next_id)
+        self._next_id += 1
+        self.descriptions.append(description)
+        for field, text in (("Quantity", quantity), ("LineTotal", line_total)):
+            values, places = self._columns(field)
+            values.append(0.0)
+            places.append(0)
+            self._write(len(self) - 1, field, text)
+
+    def get(self, index, field):
+        """The cell as text, the way it was extracted or typed"""
+        if field == "Description":
+            return self.descriptions[index]
+        values, places = self._columns(field)
+        if places[index] == RAW:
+            return self.raw[(self.ids[index], field)]
+        return f"{values[index]:.{places[index]}f}"
+
+    def set(self, index, field, value):
+        """Update one cell; returns True (and logs the diff) only if the value changed"""
+        old, new = self.get(index, field), _raw(value)
+        if new == old:
+            return False
+        if field == "Description":
+            self.descriptions[index] = new
+        else:
+            self._write(index, field, new)
+        self.changes.append(("set", self.ids[index], field, old, new))
+        return True
+
+    def is_valid(self, index, field):
+        """False if a Quantity/LineTotal cell holds something that is not a number"""
+        return field == "Description" or not math.isnan(self._columns(field)[0][index])
+
+    def invalid_cells(self):
+        """(index, field) of every amount cell that could not be parsed"""
+        return [
+            (i, field)
+            for i in range(len(self))
+            for field in ("Quantity", "LineTotal")
+            if not self.is_valid(i, field)
+        ]
+
+    def append(self, description="", quantity="", line_total=""):
+        self._append_row(description, quantity, line_total)
+        self.changes.append(("add", self.ids[-1], None, None, None))
+
+    def pop(self, index=-1):
+        if index < 0:
+            index += len(self)
+        item = self[index]
+        row_id = self.ids[index]
+        for field in ("Quantity", "LineTotal"):
+            self.raw.pop((row_id, field), None)
+        for column in (
+            self.ids, self.descriptions, self.quantities, self.quantity_places,
+            self.line_totals, self.line_total_places,
+        ):
+            del column[index]
+        self.changes.append(("remove", row_id, None, item, None))
+        return item
+
+    def line_total_sum(self):
+        # Cells that are not a number count as 0 (they are reported separately);
+        # round to 2 decimal places to fix floating-point precision
+        return round(sum(v for v in self.line_totals if not math.isnan(v)), 2)
+
+    def changed_lines(self):
+        """Current indexes of the rows touched by "set" edits, for the change summary"""
+        position = {row_id: i for i, row_id in enumerate(self.ids)}
+        return sorted({
+            position[row_id]
+            for action, row_id, *_ in self.changes
+            if action == "set" and row_id in position
+        })
+
+    def clear_changes(self):
+        self.changes = []
@@ -0,0 +1,163 @@
+# Tests for InvoiceJobQueue against a fake Snowpark session that simulates
+# AI_EXTRACT latency (no Snowflake needed):
+#   python -m pytest -q test_invoice_jobs.py
+
+import json
+import threading
+
+import pytest
+
+import invoice_jobs
+from invoice_jobs import DONE, EXTRACTING, FAILED, RETRYING, STAGE_NAME, InvoiceJobQueue
+
+RESULT = {"VendorName": "Acme", "LineTotals": ["1.00"]}
+
+
+class FakeFile:
+    def __init__(self, session):
+        self.session = session
+
+    def put_stream(self, stream, stage_location, auto_compress):
+        self.session.staged.append((stage_location, stream.read()))
+
+
+class FakeQuery:
+    def __init__(self, session, params):
+        self.session = session
+        self.params = params
+
+    def collect(self):
+        session = self.session
+        with session.lock:
+            session.running += 1
+            session.max_running = max(session.max_running, session.running)
+            error = session.errors.pop(0) if session.errors else None
+        try:
+            session.gate.wait(5)
+            # Latency of an AI_EXTRACT call; Event.wait, not time.sleep, which the tests patch
+            threading.Event().wait(session.latency)
+            if error is not None:
+                raise error
+            return [(json.dumps(RESULT),)]
+        finally:
+            with session.lock:
+                session.running -= 1
+
+
+class FakeSession:
+    def __init__(self, latency=0.05, errors=()):
+        self.latency = latency
+        self.errors = list(errors)   # raised by successive AI_EXTRACT calls
+        self.gate = threading.Event()
+        self.gate.set()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.staged = []
+        self.file = FakeFile(self)
+
+    def sql(self, query, params):
+        assert query == invoice_jobs.EXTRACT_SQL
+        return FakeQuery(self, params)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(invoice_jobs.time, "sleep", delays.append)
+    monkeypatch.setattr(invoice_jobs.random, "uniform", lambda low, high: 0.0)
+    return delays
+
+
+def run_jobs(queue, count):
+    job_ids = [queue.submit(f"invoice_{i}.pdf", b"%PDF-" + bytes([i])) for i in range(count)]
+    queue.shutdown(wait=True)
+    return [queue.get(job_id) for job_id in job_ids]
+
+
+def test_concurrency_is_capped_at_max_workers(sleeps):
+    session = FakeSession(latency=0.05)
+    jobs = run_jobs(InvoiceJobQueue(session, max_workers=3), 9)
+
+    assert session.max_running == 3
+    assert [job.status for job in jobs] == [DONE] * 9
+    assert all(job.result == RESULT and job.progress == 1.0 for job in jobs)
+    assert len(session.staged) == 9
+
+
+def test_transient_errors_are_retried_with_backoff(sleeps):
+    session = FakeSession(errors=[TimeoutError("timed out"), ConnectionError("reset")])
+    queue = InvoiceJobQueue(session, max_workers=1, max_retries=3, backoff_seconds=0.5)
+    (job,) = run_jobs(queue, 1)
+
+    assert job.status == DONE and job.error is None
+    assert sleeps == [0.5, 1.0]
+    # One staging attempt plus three extraction attempts
+    assert job.attempts == 4
+
+
+def test_transient_errors_give_up_after_max_retries(sleeps):
+    session = FakeSession(errors=[TimeoutError("timed out")] * 5)
+    (job,) = run_jobs(InvoiceJobQueue(session, max_retries=2, backoff_seconds=1.0), 1)
+
+    assert job.status == FAILED
+    assert job.error == "timed out"
+    assert sleeps == [1.0, 2.0]
+
+
+def test_non_transient_error_fails_without_retry(sleeps):
+    session = FakeSession(errors=[ValueError("bad file")])
+    (job,) = run_jobs(InvoiceJobQueue(session, max_retries=3), 1)
+
+    assert job.status == FAILED
+    assert job.error == "bad file"
+    assert job.attempts == 2
+    assert sleeps == []
+    assert job.finished_at is not None
+
+
+def test_snapshot_reports_progress_while_extracting(sleeps):
+    session = FakeSession()
+    session.gate.clear()
+    queue = InvoiceJobQueue(session, max_workers=1)
+    job = queue.get(queue.submit("invoice.pdf", b"%PDF-"))
+
+    while job.snapshot()["status"] != EXTRACTING or not session.running:
+        threading.Event().wait(0.01)
+    info = job.snapshot()
+    assert info["progress"] == 0.4
+    assert info["attempts"] == 2
+    assert info["file_path"].startswith(f"{STAGE_NAME}/invoices/")
+    assert not job.finished
+
+    session.gate.set()
+    queue.shutdown(wait=True)
+    info = job.snapshot()
+    assert (info["status"], info["progress"], info["error"]) == (DONE, 1.0, None)
+
+
+def test_retrying_status_is_visible_between_attempts(monkeypatch):
+    seen = []
+    session = FakeSession(errors=[TimeoutError("timed out")])
+    queue = InvoiceJobQueue(session, max_workers=1, backoff_seconds=0.0)
+    monkeypatch.setattr(invoice_jobs.time, "sleep", lambda delay: seen.append(queue.jobs()[0].snapshot()))
+    job = queue.get(queue.submit("invoice.pdf", b"%PDF-"))
+    queue.shutdown(wait=True)
+
+    assert [(s["status"], s["error"]) for s in seen] == [(RETRYING, "extracting attempt 1 failed: timed out")]
+    assert job.status == DONE
+
+
+def test_forget_only_drops_finished_jobs(sleeps):
+    session = FakeSession()
+    session.gate.clear()
+    queue = InvoiceJobQueue(session, max_workers=1)
+    job_id = queue.submit("invoice.pdf", b"%PDF-")
+
+    queue.forget(job_id)
+    assert queue.get(job_id) is not None
+
+    session.gate.set()
+    queue.shutdown(wait=True)
+    queue.forget(job_id)
+    assert queue.get(job_id) is None
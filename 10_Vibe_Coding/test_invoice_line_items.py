@@ -0,0 +1,111 @@
+# Tests for LineItemStore (no Streamlit or Snowflake needed):
+#   python -m pytest -q test_invoice_line_items.py
+
+import math
+
+from invoice_line_items import LineItemStore, parse_amount
+
+RESPONSE = {
+    "ItemDescriptions": ["Bolts", "Nuts", "Washers"],
+    "Quantities": ["2", "1 box", "12"],
+    "LineTotals": ["12.50", "$1,000.50", "0.5"],
+}
+
+
+def cells(store, field):
+    return [store.get(i, field) for i in range(len(store))]
+
+
+def test_parse_amount():
+    assert parse_amount("$1,000.50") == 1000.5
+    assert parse_amount("") == 0.0
+    assert parse_amount(None) == 0.0
+    assert parse_amount("None") == 0.0
+    assert parse_amount("N/A") is None
+
+
+def test_from_extracted_keeps_the_extracted_text():
+    store = LineItemStore.from_extracted(RESPONSE)
+
+    assert cells(store, "Description") == RESPONSE["ItemDescriptions"]
+    assert cells(store, "Quantity") == RESPONSE["Quantities"]
+    assert cells(store, "LineTotal") == RESPONSE["LineTotals"]
+    assert [item.line_number for item in store] == [1, 2, 3]
+
+
+def test_amounts_are_typed_and_raw_text_is_the_exception():
+    store = LineItemStore.from_extracted(RESPONSE)
+
+    assert store.quantities.typecode == store.line_totals.typecode == "d"
+    assert list(store.line_totals) == [12.5, 1000.5, 0.5]
+    assert math.isnan(store.quantities[1])
+    # Only "1 box" and "$1,000.50" can't be rebuilt from number + decimals
+    assert sorted(store.raw.values()) == ["$1,000.50", "1 box"]
+
+
+def test_shorter_arrays_are_padded_with_blank_cells():
+    store = LineItemStore.from_extracted({"ItemDescriptions": ["a", "b"], "LineTotals": ["1"]})
+
+    assert cells(store, "Quantity") == ["", ""]
+    assert cells(store, "LineTotal") == ["1", ""]
+    assert store.invalid_cells() == []
+
+
+def test_invalid_cells_and_line_total_sum():
+    store = LineItemStore.from_extracted(RESPONSE)
+
+    assert store.invalid_cells() == [(1, "Quantity")]
+    assert store.line_total_sum() == 1013.5
+
+    store.set(0, "LineTotal", "N/A")
+    assert not store.is_valid(0, "LineTotal")
+    assert store.get(0, "LineTotal") == "N/A"
+    assert store.line_total_sum() == 1001.0
+
+    store.set(0, "LineTotal", "7.25")
+    assert store.is_valid(0, "LineTotal")
+    assert (store.ids[0], "LineTotal") not in store.raw
+    assert store.line_total_sum() == 1008.25
+
+
+def test_set_logs_only_real_changes():
+    store = LineItemStore.from_extracted(RESPONSE)
+
+    assert not store.set(0, "LineTotal", "12.50")
+    assert store.set(0, "LineTotal", "12.5")
+    assert store.set(2, "Description", "Flat washers")
+    assert store.changes == [
+        ("set", 0, "LineTotal", "12.50", "12.5"),
+        ("set", 2, "Description", "Washers", "Flat washers"),
+    ]
+    assert store.changed_lines() == [0, 2]
+
+    store.clear_changes()
+    assert store.changes == [] and store.changed_lines() == []
+
+
+def test_diff_log_row_ids_survive_pop():
+    store = LineItemStore.from_extracted(RESPONSE)
+    store.set(2, "Quantity", "13")
+
+    removed = store.pop(0)
+    assert removed.description == "Bolts"
+    store.set(1, "Quantity", "14")
+    store.append("Screws", "3", "4.00")
+
+    # Both edits were to the Washers row (id 2), now at index 1
+    assert [c[1] for c in store.changes if c[0] == "set"] == [2, 2]
+    assert store.changes[1] == ("remove", 0, None, removed, None)
+    assert store.changes[-1] == ("add", 3, None, None, None)
+    assert store.changed_lines() == [1]
+    assert cells(store, "Quantity") == ["1 box", "14", "3"]
+    assert cells(store, "LineTotal") == ["$1,000.50", "0.5", "4.00"]
+
+
+def test_pop_drops_raw_text_of_the_removed_row():
+    store = LineItemStore.from_extracted(RESPONSE)
+    store.pop(1)
+
+    assert store.raw == {}
+    assert store.pop().line_number == 2
+    assert len(store) == 1